@@ -1,4 +1,42 @@
-import requests
+from transport import shared_session
+from uploader import shared_uploader
+from spool import retryable, shared_spool
+
+# Endpoints that can be fed through the background uploader: name -> (url, body format)
+UPLOAD_ENDPOINTS = {
+    "quote": ('https://trading.omsaiservices.in/quote', "form"),
+    "historical_data": ('https://trading.omsaiservices.in/historical_data', "form"),
+    "sec_data": ('https://trading.omsaiservices.in/sec-data', "form"),
+    "quote_data": ('https://trading.omsaiservices.in/quote_data_api', "json"),
+    "positions": ('https://trading.omsaiservices.in/positions', "json"),
+    "indices": ('https://trading.omsaiservices.in/indices_data', "json"),
+}
+
+
+def queue_upload(endpoint, payload, block=True, timeout=None):
+    """Hand a payload to the background uploader instead of POSTing it now.
+
+    Same payloads as the matching *_api function (form dict or JSON string).
+    Returns False if the queue stayed full for `timeout` seconds.
+    """
+    return shared_uploader(UPLOAD_ENDPOINTS, spool=shared_spool()).submit(endpoint, payload, block, timeout)
+
+
+def post_or_spool(url, data=None, headers=None):
+    """POST over the shared session; an upload that may succeed later is kept in the disk spool for replay.
+
+    Responses the backend rejects outright (most 4xx) are returned as they
+    are, retrying them would only fail again.
+    """
+    body = "json" if headers and headers.get('Content-Type') == 'application/json' else "form"
+    try:
+        response = shared_session().post(url, data=data, headers=headers)
+    except Exception:
+        shared_spool().append(url, data, body, headers)
+        raise
+    if response.status_code != 200 and retryable(response.status_code):
+        shared_spool().append(url, data, body, headers)
+    return response
 
 
 def update_token_api(userid,entoken,funds):
@@ -10,7 +48,7 @@ def update_token_api(userid,entoken,funds):
         "funds":funds
     }   
     # Making a PUT or PATCH request with the new data
-    response = requests.post(url=upate_token_api, data=update_token)  # Use 'requests.patch' for a PATCH request
+    response = shared_session().post(url=upate_token_api, data=update_token)  # Use 'requests.patch' for a PATCH request
     # Checking if the request was successful (status code 200 for successful update)
     if response.status_code == 200:
         updated_data = response.json()  # Assuming the API returns updated data
@@ -21,7 +59,8 @@ def update_token_api(userid,entoken,funds):
 def insert_api(register):
     insert_url='https://trading.omsaiservices.in/create-user'
     
-    response = requests.post(url=insert_url,data=register)  # Use 'requests.patch' for a PATCH request
+    # Not spooled: creating a user has no dedupe key, a replay after a lost response could create it twice
+    response = shared_session().post(insert_url, data=register)  # Use 'requests.patch' for a PATCH request
 
     # Checking if the request was successful (status code 200 for successful update)
     if response.status_code == 200:
@@ -35,7 +74,7 @@ def insert_api(register):
 def insert_api_hist(historical_data):
     insert_url='https://trading.omsaiservices.in/historical_data'
     
-    response = requests.post(url=insert_url,data=historical_data)  # Use 'requests.patch' for a PATCH request
+    response = post_or_spool(insert_url, data=historical_data)  # Use 'requests.patch' for a PATCH request
 
     # Checking if the request was successful (status code 200 for successful update)
     if response.status_code == 200:
@@ -47,7 +86,7 @@ def insert_api_hist(historical_data):
 def insert_api_quote(quote):
     insert_url='https://trading.omsaiservices.in/quote'
     
-    response = requests.post(url=insert_url,data=quote)  # Use 'requests.patch' for a PATCH request
+    response = post_or_spool(insert_url, data=quote)  # Use 'requests.patch' for a PATCH request
 
     # Checking if the request was successful (status code 200 for successful update)
     if response.status_code == 200:
@@ -60,7 +99,7 @@ def insert_api_quote(quote):
 def margins_api(register):
     insert_url='https://trading.omsaiservices.in/margins'
     
-    response = requests.post(url=insert_url,data=register)  # Use 'requests.patch' for a PATCH request
+    response = post_or_spool(insert_url, data=register)  # Use 'requests.patch' for a PATCH request
 
     # Checking if the request was successful (status code 200 for successful update)
     if response.status_code == 200:
@@ -72,7 +111,7 @@ def margins_api(register):
 def funds_api(funds):
     insert_url='https://trading.omsaiservices.in/funds'
     
-    response = requests.post(url=insert_url,data=funds)  # Use 'requests.patch' for a PATCH request
+    response = post_or_spool(insert_url, data=funds)  # Use 'requests.patch' for a PATCH request
     print(response)
     # Checking if the request was successful (status code 200 for successful update)
     if response.status_code == 200:
@@ -87,7 +126,7 @@ def positions_api(json_data):
     headers = {'Content-Type': 'application/json'}
 
     # Send POST request
-    response = requests.post(url, data=json_data, headers=headers)
+    response = post_or_spool(url, data=json_data, headers=headers)
 
     # Check the response
     if response.status_code == 200:
@@ -103,7 +142,7 @@ def indices_api(json_data):
     headers = {'Content-Type': 'application/json'}
 
     # Send POST request
-    response = requests.post(url, data=json_data, headers=headers)
+    response = post_or_spool(url, data=json_data, headers=headers)
 
     # Check the response
     if response.status_code == 200:
@@ -118,7 +157,7 @@ def quote_data_api(json_data):
     headers = {'Content-Type': 'application/json'}
 
     # Send POST request
-    response = requests.post(url, data=json_data, headers=headers)
+    response = post_or_spool(url, data=json_data, headers=headers)
 
     # Check the response
     if response.status_code == 200:
@@ -131,7 +170,7 @@ def quote_data_api(json_data):
 def sec_data_api(sec):
     insert_url='https://trading.omsaiservices.in/sec-data'
     
-    response = requests.post(url=insert_url,data=sec)  # Use 'requests.patch' for a PATCH request
+    response = post_or_spool(insert_url, data=sec)  # Use 'requests.patch' for a PATCH request
 
     # Checking if the request was successful (status code 200 for successful update)
     if response.status_code == 200:
@@ -141,7 +180,7 @@ def sec_data_api(sec):
 def back_test_api(register):
     insert_url='https://trading.omsaiservices.in/back-test'
     
-    response = requests.post(url=insert_url,data=register)  # Use 'requests.patch' for a PATCH request
+    response = post_or_spool(insert_url, data=register)  # Use 'requests.patch' for a PATCH request
     print(response)
     # Checking if the request was successful (status code 200 for successful update)
     if response.status_code == 200:
@@ -150,7 +189,7 @@ def back_test_api(register):
         print('Failed to insert data via the API')
 def user_details():
     get_user_url='https://trading.omsaiservices.in/user'
-    response = requests.get(url=get_user_url)  
+    response = shared_session().get(url=get_user_url)  
     if response.status_code == 200:
         user_data = response.json() 
         return user_data  # Display or handle the updated data
@@ -1,47 +1,102 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from kite_trade import *
 from api import *
+from token_store import config_store
 import pyotp
 
-# Step 1: Read existing JSON data from config.json
-with open('config.json', 'r') as file:
-    config_data = json.load(file)
-ud = user_details()
-for uses in ud['users']:
-    token =uses['entoken']
-    kite = KiteApp(enctoken=token)
-    profile =kite.profile()
-    if profile:
-        if profile['user_id']==uses['user_id']:
-            
-            balance = kite.margins()["equity"]['available']["live_balance"]
-            
-            config_data[uses['user_id']] = token
-            with open('config.json', 'w') as file:
-                json.dump(config_data, file, indent=2)
-                print('Config file updated successfully.',uses['user_name'],balance)
-    else:
-        with open('users_details.json') as f:
-            udg = json.load(f)
-            for ud in udg:
-                if ud['user_id']==uses['user_id']:                   
-                    if len(uses['secret_key'])>5:
-                        totp = pyotp.TOTP(uses['secret_key'])
-                        twofa = totp.now()
-                        print(ud['user_id']," TOTP:",twofa)
-                    else:
-                        twofa = input('Please Enter TOTP for '+ud['user_id']+' :')
-                    if twofa:
-                        get_token = get_enctoken(ud['user_id'], ud['password'], twofa)
-                        kite_new = KiteApp(enctoken=get_token)
-                        marginr = dict(kite_new.margins())
-                        balancer = int(marginr["equity"]['available']["live_balance"])
-                        try:
-                            update_token_api(ud['user_id'],get_token,balancer)
-                            config_data[ud['user_id']] = get_token
-                            with open('config.json', 'w') as file:
-                                json.dump(config_data, file, indent=2)
-                                print('Config file updated successfully.')
-                        except:
-                            print("Failed to Update Token",ud['user_id'])
-                    
+# Accounts checked / logged in at the same time
+MAX_WORKERS = 16
+
+
+def check_token(user):
+    """Balance if the account's stored enctoken is still valid, else None"""
+    try:
+        kite = KiteApp(enctoken=user['entoken'])
+        profile = kite.profile()
+        if profile and profile['user_id'] == user['user_id']:
+            return kite.margins()["equity"]['available']["live_balance"]
+    except Exception as e:
+        print("Token check failed", user['user_id'], e)
+    return None
+
+
+def refresh_token(login, twofa):
+    """Log in again, push the new token to the API and return (token, balance)"""
+    token = get_enctoken(login['user_id'], login['password'], twofa, save=False)
+    kite_new = KiteApp(enctoken=token)
+    marginr = dict(kite_new.margins())
+    balance = int(marginr["equity"]['available']["live_balance"])
+    update_token_api(login['user_id'], token, balance)
+    return token, balance
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    try:
+        return fn(*args), None, time.perf_counter() - start
+    except Exception as e:
+        return None, e, time.perf_counter() - start
+
+
+def main():
+    tokens = {}
+    with open('users_details.json') as f:
+        logins = {ud['user_id']: ud for ud in json.load(f)}
+    users = user_details()['users']
+    report = {}
+
+    # Step 1: validate every stored token at once
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        checked = list(zip(users, pool.map(lambda u: timed(check_token, u), users)))
+    expired = []
+    for user, (balance, _, elapsed) in checked:
+        if balance is not None:
+            tokens[user['user_id']] = user['entoken']
+            report[user['user_id']] = ("valid", elapsed)
+            print('Token valid.', user['user_name'], balance)
+        elif user['user_id'] in logins:
+            expired.append(user)
+        else:
+            report[user['user_id']] = ("expired, no login details", elapsed)
+
+    # Step 2: log the expired ones back in. TOTP codes are generated inside the worker so they
+    # are fresh when sent. Accounts without a secret need a code typed in; each is asked for just
+    # before its own login, while the generated-code logins run in the pool, so it cannot expire
+    # waiting behind the other prompts
+    def login(user, twofa=None):
+        twofa = twofa or pyotp.TOTP(user['secret_key']).now()
+        return refresh_token(logins[user['user_id']], twofa)
+
+    automatic = [u for u in expired if len(u['secret_key']) > 5]
+    manual = [u for u in expired if len(u['secret_key']) <= 5]
+    logged_in = []
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = [(u, pool.submit(timed, login, u)) for u in automatic]
+        for user in manual:
+            twofa = input('Please Enter TOTP for ' + user['user_id'] + ' :').strip()
+            if not twofa:
+                report[user['user_id']] = ("skipped, no TOTP entered", 0.0)
+                continue
+            logged_in.append((user, timed(login, user, twofa)))
+        logged_in += [(user, future.result()) for user, future in futures]
+    for user, (result, error, elapsed) in logged_in:
+        if error is not None:
+            report[user['user_id']] = ("login failed", elapsed)
+            print("Failed to Update Token", user['user_id'], error)
+            continue
+        token, balance = result
+        tokens[user['user_id']] = token
+        report[user['user_id']] = ("refreshed", elapsed)
+        print('Token refreshed.', user['user_name'], balance)
+
+    # Step 3: one atomic update for all accounts, other keys in config.json are left alone
+    changed = config_store().update(tokens)
+    print('Config file updated successfully.', len(changed), 'tokens changed')
+    for user_id, (status, elapsed) in report.items():
+        print(f"{user_id:<12} {status:<28} {elapsed:6.2f}s")
+
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import asyncio
+
+import aiohttp
+
+from kite_trade import KiteApp, BulkResult, order_id_from
+from ratelimit import RateLimiter
+from timestamps import parse_timestamp
+
+
+class AsyncKiteApp:
+    """asyncio counterpart of KiteApp on one pooled aiohttp session.
+
+    Same method names and return shapes as KiteApp, but every call is a
+    coroutine, so a single event loop can keep hundreds of requests in
+    flight. Requests still wait on the per-endpoint and overall rate
+    limits before they are sent.
+
+        async with AsyncKiteApp(enctoken) as kite:
+            quotes, positions = await asyncio.gather(kite.quote(symbols), kite.positions())
+    """
+
+    def __init__(self, enctoken, root_url="https://kite.zerodha.com/oms", connections=100):
+        self.enctoken = enctoken
+        self.headers = {
+            "x-kite-version": "3",
+            'Authorization': 'enctoken {}'.format(self.enctoken)
+        }
+        self.root_url = root_url
+        self.connections = connections
+        self.limiters = {name: RateLimiter(rate) for name, rate in KiteApp.RATE_LIMITS.items()}
+        self.total = RateLimiter(KiteApp.TOTAL_RATE_LIMIT)
+        self.session = None
+
+    async def __aenter__(self):
+        self._ensure_session()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _ensure_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=aiohttp.TCPConnector(limit=self.connections, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=30, connect=3.05))
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+    async def _acquire(self, endpoint):
+        limiter = self.limiters.get(endpoint) or self.limiters["default"]
+        while not limiter.try_acquire():
+            await asyncio.sleep(limiter.delay())
+        while not self.total.try_acquire():
+            await asyncio.sleep(self.total.delay())
+
+    async def _request(self, method, path, endpoint, params=None, data=None):
+        await self._acquire(endpoint)
+        if data is not None:
+            # requests drops None form values silently, aiohttp would reject them
+            data = {k: v for k, v in data.items() if v is not None}
+        async with self._ensure_session().request(method, f"{self.root_url}{path}", params=params,
+                                                  data=data) as response:
+            return await response.json(content_type=None)
+
+    @staticmethod
+    def _instrument_params(instruments):
+        if isinstance(instruments, str):
+            instruments = [instruments]
+        return [("i", i) for i in instruments]
+
+    async def quote(self, instruments):
+        if not isinstance(instruments, str) and len(instruments) > KiteApp.QUOTE_CHUNK_SIZE:
+            return (await self.bulk_quote(instruments)).data
+        return (await self._request("GET", "/quote", "quote", params=self._instrument_params(instruments)))["data"]
+
+    async def ltp(self, instruments):
+        if not isinstance(instruments, str) and len(instruments) > KiteApp.LTP_CHUNK_SIZE:
+            return {"status": "success", "data": (await self.bulk_ltp(instruments)).data}
+        return await self._request("GET", "/quote/ltp", "quote", params=self._instrument_params(instruments))
+
+    async def _bulk(self, path, instruments, chunk_size):
+        instruments = list(dict.fromkeys(instruments))
+        chunks = [instruments[i:i + chunk_size] for i in range(0, len(instruments), chunk_size)]
+        responses = await asyncio.gather(
+            *(self._request("GET", path, "quote", params=self._instrument_params(chunk)) for chunk in chunks),
+            return_exceptions=True)
+        result = BulkResult()
+        for chunk, response in zip(chunks, responses):
+            if isinstance(response, Exception):
+                result.errors.append({"instruments": chunk, "error": str(response)})
+            elif response.get("status") != "success":
+                result.errors.append({"instruments": chunk, "error": response.get("message", "request failed")})
+            else:
+                result.data.update(response["data"])
+        return result
+
+    async def bulk_quote(self, instruments):
+        return await self._bulk("/quote", instruments, KiteApp.QUOTE_CHUNK_SIZE)
+
+    async def bulk_ltp(self, instruments):
+        return await self._bulk("/quote/ltp", instruments, KiteApp.LTP_CHUNK_SIZE)
+
+    async def historical_data(self, instrument_token, from_date, to_date, interval, continuous=False, oi=False):
+        params = {"from": from_date,
+                  "to": to_date,
+                  "interval": interval,
+                  "continuous": 1 if continuous else 0,
+                  "oi": 1 if oi else 0}
+        lst = (await self._request("GET", f"/instruments/historical/{instrument_token}/{interval}", "historical",
+                                   params=params))["data"]["candles"]
+        records = []
+        for i in lst:
+            record = {"date": parse_timestamp(i[0]), "open": i[1], "high": i[2], "low": i[3],
+                      "close": i[4], "volume": i[5]}
+            if len(i) == 7:
+                record["oi"] = i[6]
+            records.append(record)
+        return records
+
+    async def margins(self):
+        return (await self._request("GET", "/user/margins", "default"))["data"]
+
+    async def profile(self):
+        return (await self._request("GET", "/user/profile/full", "default"))["data"]
+
+    async def orders(self):
+        return (await self._request("GET", "/orders", "default"))["data"]
+
+    async def positions(self):
+        return (await self._request("GET", "/portfolio/positions", "default"))["data"]
+
+    async def holdings(self):
+        return (await self._request("GET", "/portfolio/holdings", "default"))["data"]
+
+    async def place_order(self, variety, exchange, tradingsymbol, transaction_type, quantity, product, order_type,
+                          price=None, validity=None, disclosed_quantity=None, trigger_price=None, squareoff=None,
+                          stoploss=None, trailing_stoploss=None, tag=None):
+        params = locals()
+        del params["self"]
+        response = await self._request("POST", f"/orders/{variety}", "order", data=params)
+        return order_id_from(response)
+
+    async def modify_order(self, variety, order_id, parent_order_id=None, quantity=None, price=None, order_type=None,
+                           trigger_price=None, validity=None, disclosed_quantity=None):
+        params = locals()
+        del params["self"]
+        response = await self._request("PUT", f"/orders/{variety}/{order_id}", "order", data=params)
+        return order_id_from(response)
+
+    async def cancel_order(self, variety, order_id, parent_order_id=None):
+        response = await self._request("DELETE", f"/orders/{variety}/{order_id}", "order",
+                                       data={"parent_order_id": parent_order_id})
+        return order_id_from(response)
+
+    async def _regular_order(self, params):
+        return await self._request("POST", "/orders/regular", "order", data=params)
+
+    async def buy_equity(self, tradingsymbol, quantity, transaction_type, tag=None):
+        return await self._regular_order({'exchange': 'NSE', 'tradingsymbol': tradingsymbol,
+                                          'transaction_type': transaction_type, 'quantity': quantity,
+                                          'product': 'CNC', 'order_type': 'MARKET', 'tag': tag})
+
+    async def buy(self, tradingsymbol, quantity, transaction_type, tag=None):
+        return await self._regular_order({'exchange': 'NFO', 'tradingsymbol': tradingsymbol,
+                                          'transaction_type': transaction_type, 'quantity': quantity,
+                                          'product': 'MIS', 'order_type': 'MARKET', 'tag': tag})
+
+    async def buy_limit(self, tradingsymbol, quantity, price, transaction_type, tag=None):
+        return await self._regular_order({'exchange': 'NFO', 'tradingsymbol': tradingsymbol,
+                                          'transaction_type': transaction_type, 'quantity': quantity,
+                                          'product': 'MIS', 'price': price, 'order_type': 'LIMIT', 'tag': tag})
+
+    async def sell_target(self, tradingsymbol, quantity, price, tag=None):
+        return await self._regular_order({'exchange': 'NFO', 'tradingsymbol': tradingsymbol,
+                                          'transaction_type': 'SELL', 'price': price, 'quantity': quantity,
+                                          'product': 'MIS', 'order_type': 'LIMIT', 'tag': tag})
+
+    async def sell_sl(self, tradingsymbol, quantity, price, trigger_price, tag=None):
+        return await self._regular_order({'exchange': 'NFO', 'tradingsymbol': tradingsymbol,
+                                          'transaction_type': 'SELL', 'price': price,
+                                          'trigger_price': trigger_price, 'quantity': quantity,
+                                          'product': 'MIS', 'order_type': 'SL', 'tag': tag})
+
+    async def modify_order_exit(self, order_id, quantity):
+        params = {'order_id': order_id, 'quantity': quantity, 'order_type': 'MARKET', 'validity': 'DAY'}
+        return await self._request("PUT", f"/orders/regular/{order_id}", "order", data=params)
@@ -0,0 +1,194 @@
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from kite_trade import KiteApp
+
+
+class OrderIntent:
+    """One order to be placed identically (up to quantity) on several accounts"""
+    __slots__ = ("tradingsymbol", "transaction_type", "quantity", "exchange", "product", "order_type", "variety",
+                 "price", "trigger_price", "validity", "tag")
+
+    def __init__(self, tradingsymbol, transaction_type, quantity, exchange="NFO", product="MIS", order_type="MARKET",
+                 variety="regular", price=None, trigger_price=None, validity=None, tag=None):
+        self.tradingsymbol = tradingsymbol
+        self.transaction_type = transaction_type
+        self.quantity = quantity
+        self.exchange = exchange
+        self.product = product
+        self.order_type = order_type
+        self.variety = variety
+        self.price = price
+        self.trigger_price = trigger_price
+        self.validity = validity
+        self.tag = tag
+
+    def params(self, quantity=None):
+        """Keyword arguments for KiteApp.place_order"""
+        return {"variety": self.variety, "exchange": self.exchange, "tradingsymbol": self.tradingsymbol,
+                "transaction_type": self.transaction_type, "quantity": quantity or self.quantity,
+                "product": self.product, "order_type": self.order_type, "price": self.price,
+                "trigger_price": self.trigger_price, "validity": self.validity, "tag": self.tag}
+
+
+class OrderResult:
+    """Outcome of one account's order: order id or error, and send-to-ack latency in seconds"""
+    __slots__ = ("user_id", "order_id", "error", "latency")
+
+    def __init__(self, user_id, order_id=None, error=None, latency=None):
+        self.user_id = user_id
+        self.order_id = order_id
+        self.error = error
+        self.latency = latency
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        outcome = self.order_id if self.ok else f"error={self.error!r}"
+        latency = "-" if self.latency is None else f"{self.latency * 1000:.1f}ms"
+        return f"OrderResult({self.user_id}, {outcome}, {latency})"
+
+
+class BasketDispatcher:
+    """Places one order intent on many accounts at once.
+
+    A KiteApp (and so a warmed-up keep-alive session) is created per account
+    when the dispatcher is built, so dispatch() only pays for the order
+    request itself. All workers wait on a barrier and fire together, which
+    keeps the spread between the first and last account's order small.
+
+        dispatcher = BasketDispatcher({"AB1234": enctoken1, "CD5678": enctoken2})
+        results = dispatcher.dispatch(OrderIntent("NIFTY24JUNFUT", "BUY", 50))
+
+    With dry_run=True every account talks to a local StandInServer instead
+    of the broker.
+    """
+
+    def __init__(self, accounts, dry_run=False, root_url=None):
+        self.server = StandInServer().start() if dry_run else None
+        if self.server is not None:
+            root_url = self.server.url
+        kwargs = {"root_url": root_url} if root_url else {}
+        with ThreadPoolExecutor(max_workers=max(len(accounts), 1)) as pool:
+            kites = pool.map(lambda token: KiteApp(enctoken=token, **kwargs), accounts.values())
+            self.kites = dict(zip(accounts, kites))
+
+    def close(self):
+        if self.server is not None:
+            self.server.stop()
+
+    def _place(self, kite, user_id, params, barrier, timeout):
+        try:
+            barrier.wait(timeout)
+        except threading.BrokenBarrierError:
+            # Another worker never arrived; firing alone would defeat the point of the basket
+            return OrderResult(user_id, error="Order not sent: basket barrier broken")
+        start = time.perf_counter()
+        try:
+            order_id = kite.place_order(**params)
+            return OrderResult(user_id, order_id=order_id, latency=time.perf_counter() - start)
+        except Exception as e:
+            return OrderResult(user_id, error=str(e), latency=time.perf_counter() - start)
+
+    def dispatch(self, intent, accounts=None, quantities=None, timeout=10):
+        """Send `intent` to every account (or the listed ones) concurrently.
+
+        `quantities` optionally maps user id to a per-account quantity.
+        Accounts the dispatcher has no session for get an error result
+        without sending anything; if the workers do not all reach the
+        barrier within `timeout` seconds none of the orders are sent.
+        Returns {user_id: OrderResult}.
+        """
+        accounts = list(self.kites if accounts is None else accounts)
+        quantities = quantities or {}
+        results = {user_id: OrderResult(user_id, error="Unknown account")
+                   for user_id in accounts if user_id not in self.kites}
+        known = [user_id for user_id in accounts if user_id in self.kites]
+        if not known:
+            return results
+        barrier = threading.Barrier(len(known))
+        with ThreadPoolExecutor(max_workers=len(known)) as pool:
+            futures = [pool.submit(self._place, self.kites[user_id], user_id,
+                                   intent.params(quantities.get(user_id)), barrier, timeout)
+                       for user_id in known]
+            results.update((result.user_id, result) for result in (future.result() for future in futures))
+        return {user_id: results[user_id] for user_id in accounts}
+
+
+class StandInServer:
+    """Local HTTP server answering like the broker's order endpoints.
+
+    Orders get sequential fake ids and are kept in `orders`; any other GET
+    returns an empty success. `latency` adds a fixed delay per response.
+    While `reject` is set, order requests are answered with a 400 and that
+    message, the way the broker rejects an order.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, reject=None):
+        self.latency = latency
+        self.reject = reject
+        self.orders = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self.host, self.port = self._server.server_address[:2]
+        self.url = f"http://{self.host}:{self.port}/oms"
+        self._thread = threading.Thread(target=self._server.serve_forever, name="order-stand-in", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _record(self, path, body):
+        with self._lock:
+            order_id = str(next(self._ids))
+            self.orders.append({"order_id": order_id, "path": path, "params": body})
+        return order_id
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, data, status=200):
+                if stand_in.latency:
+                    time.sleep(stand_in.latency)
+                if status == 200:
+                    body = json.dumps({"status": "success", "data": data}).encode()
+                else:
+                    body = json.dumps({"status": "error", "message": data, "error_type": "InputException"}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _order(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode() if length else ""
+                if stand_in.reject:
+                    self._reply(stand_in.reject, 400)
+                else:
+                    self._reply({"order_id": stand_in._record(self.path, body)})
+
+            do_POST = do_PUT = do_DELETE = _order
+
+            def do_GET(self):
+                self._reply({})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
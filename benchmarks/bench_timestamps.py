@@ -0,0 +1,45 @@
+"""Compare dateutil with timestamps.parse_timestamp on a multi-year minute series.
+
+    python benchmarks/bench_timestamps.py [years]
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dateutil.parser
+from timestamps import parse_timestamp
+
+
+def minute_series(years):
+    """Broker-formatted timestamps for every minute of every weekday session"""
+    stamps = []
+    day = datetime(2020, 1, 1)
+    for _ in range(365 * years):
+        if day.weekday() < 5:
+            minute = day.replace(hour=9, minute=15)
+            for _ in range(375):
+                stamps.append(minute.strftime("%Y-%m-%dT%H:%M:%S+0530"))
+                minute += timedelta(minutes=1)
+        day += timedelta(days=1)
+    return stamps
+
+
+def timed(parse, stamps):
+    started = time.perf_counter()
+    parsed = [parse(s) for s in stamps]
+    return time.perf_counter() - started, parsed
+
+
+if __name__ == "__main__":
+    years = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    stamps = minute_series(years)
+    slow, expected = timed(dateutil.parser.parse, stamps)
+    fast, parsed = timed(parse_timestamp, stamps)
+    assert parsed == expected, "fast path disagrees with dateutil"
+    print(f"{len(stamps)} timestamps over {years} years")
+    print(f"dateutil.parser.parse: {slow:.3f}s ({slow / len(stamps) * 1e6:.2f} us each)")
+    print(f"parse_timestamp:       {fast:.3f}s ({fast / len(stamps) * 1e6:.2f} us each)")
+    print(f"speedup: {slow / fast:.1f}x")
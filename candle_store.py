@@ -0,0 +1,152 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from timestamps import IST, parse_timestamp
+
+DEFAULT_PATH = os.path.join(os.getenv("KITE_CACHE_DIR", ".kite_cache"), "candles.db")
+
+# Length of one candle per interval, in seconds
+INTERVAL_SECONDS = {
+    "minute": 60,
+    "3minute": 180,
+    "5minute": 300,
+    "10minute": 600,
+    "15minute": 900,
+    "30minute": 1800,
+    "60minute": 3600,
+    "day": 86400,
+}
+
+# How long after a candle closes the broker may take to publish it; coverage
+# never extends into this window unless the candle was actually returned
+PUBLISH_LAG = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS candles (
+    instrument_token INTEGER NOT NULL,
+    interval TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    open REAL, high REAL, low REAL, close REAL,
+    volume INTEGER,
+    oi INTEGER,
+    PRIMARY KEY (instrument_token, interval, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS coverage (
+    instrument_token INTEGER NOT NULL,
+    interval TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS coverage_key ON coverage (instrument_token, interval, start);
+"""
+
+
+def to_epoch(value):
+    """Epoch seconds for a datetime, date string or broker timestamp (naive means IST)"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    if not isinstance(value, datetime):
+        value = parse_timestamp(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=IST)
+    return int(value.timestamp())
+
+
+def format_epoch(ts):
+    return datetime.fromtimestamp(ts, IST).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class CandleStore:
+    """On-disk candle cache keyed by instrument, interval and timestamp.
+
+    Alongside the candles it records which time ranges have been fully
+    downloaded, so `missing_ranges()` can tell an empty stretch of market
+    (holiday, no trades) from one that was simply never fetched.
+
+    The SQLite connection is opened on first use and reopened in a forked
+    child, so a store created before gunicorn forks its workers never
+    shares a connection between processes.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    @property
+    def _db(self):
+        if self._pid != os.getpid():
+            # The parent's connection (if any) is left alone, SQLite must not use it across a fork
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._conn
+
+    def missing_ranges(self, instrument_token, interval, from_date, to_date):
+        """Sub-ranges of [from_date, to_date] not yet downloaded, as epoch pairs"""
+        start, end = to_epoch(from_date), to_epoch(to_date)
+        with self._lock:
+            covered = self._db.execute(
+                "SELECT start, end FROM coverage WHERE instrument_token = ? AND interval = ? "
+                "AND start <= ? AND end >= ? ORDER BY start",
+                (instrument_token, interval, end, start)).fetchall()
+        gaps = []
+        cursor = start
+        for c_start, c_end in covered:
+            if c_start > cursor:
+                gaps.append((cursor, c_start))
+            cursor = max(cursor, c_end)
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def write(self, instrument_token, interval, records, from_date, to_date):
+        """Store downloaded candles and mark [from_date, to_date] as covered.
+
+        Coverage ends at the last candle the broker returned (it may still
+        be forming and is refetched next time), or PUBLISH_LAG seconds
+        before the newest closed candle if that is later. A candle the
+        broker had not published yet at the minute rollover is therefore
+        fetched again by the next request instead of being skipped.
+        """
+        start = to_epoch(from_date)
+        rows = [(instrument_token, interval, to_epoch(r["date"]), r["open"], r["high"], r["low"], r["close"],
+                 r["volume"], r.get("oi")) for r in records]
+        settled = int(datetime.now(IST).timestamp()) - INTERVAL_SECONDS.get(interval, 60) - PUBLISH_LAG
+        end = min(to_epoch(to_date), max([settled] + [row[2] for row in rows]))
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO candles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            if end <= start:
+                return
+            overlapping = self._db.execute(
+                "SELECT rowid, start, end FROM coverage WHERE instrument_token = ? AND interval = ? "
+                "AND start <= ? AND end >= ?",
+                (instrument_token, interval, end, start)).fetchall()
+            for rowid, c_start, c_end in overlapping:
+                start, end = min(start, c_start), max(end, c_end)
+                self._db.execute("DELETE FROM coverage WHERE rowid = ?", (rowid,))
+            self._db.execute("INSERT INTO coverage VALUES (?, ?, ?, ?)", (instrument_token, interval, start, end))
+
+    def rows(self, instrument_token, interval, from_date, to_date):
+        """Raw (epoch, open, high, low, close, volume, oi) tuples in [from_date, to_date]"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT ts, open, high, low, close, volume, oi FROM candles "
+                "WHERE instrument_token = ? AND interval = ? AND ts BETWEEN ? AND ? ORDER BY ts",
+                (instrument_token, interval, to_epoch(from_date), to_epoch(to_date))).fetchall()
+
+    def read(self, instrument_token, interval, from_date, to_date):
+        """Candles in [from_date, to_date] in the same shape as KiteApp.historical_data"""
+        records = []
+        for ts, o, h, l, c, v, oi in self.rows(instrument_token, interval, from_date, to_date):
+            record = {"date": datetime.fromtimestamp(ts, IST), "open": o, "high": h, "low": l, "close": c, "volume": v}
+            if oi is not None:
+                record["oi"] = oi
+            records.append(record)
+        return records
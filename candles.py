@@ -0,0 +1,137 @@
+from array import array
+from collections import deque
+from datetime import timedelta, timezone
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+
+class CandleBuilder:
+    """Builds 1-minute OHLCV candles incrementally from quotes or ticks.
+
+    Feed it (time, last price, cumulative day volume) as often as quotes
+    arrive. The minute's volume is the cumulative volume delta since the
+    last update of the previous minute, the same number the dashboard shows
+    as `cv`. `update()` returns the finished candle when a new minute starts.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.current = None
+        self.last_closed_partial = False
+        self._partial = True
+        self._start_volume = None
+        self._last_volume = None
+
+    def update(self, when, price, cumulative_volume):
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=IST)
+        minute = when.replace(second=0, microsecond=0)
+        closed = None
+        if self.current is not None and minute > self.current['date']:
+            closed = self.current
+            self.last_closed_partial = self._partial
+            self._partial = False
+            self.current = None
+
+        if self.current is None:
+            if self._last_volume is None:
+                self._start_volume = cumulative_volume
+            else:
+                self._start_volume = self._last_volume
+            self.current = {'date': minute, 'open': price, 'high': price, 'low': price,
+                            'close': price, 'volume': 0}
+        elif minute < self.current['date']:
+            # Stale quote from the previous minute, it no longer belongs anywhere
+            return None
+
+        candle = self.current
+        if price > candle['high']:
+            candle['high'] = price
+        if price < candle['low']:
+            candle['low'] = price
+        candle['close'] = price
+        candle['volume'] = cumulative_volume - self._start_volume
+        self._last_volume = cumulative_volume
+        return closed
+
+
+class CandleRing:
+    """Fixed-capacity rolling window of candles stored column-wise.
+
+    Prices and volumes live in preallocated arrays, so memory is bounded by
+    `capacity` no matter how long the process runs. Highest volume and
+    highest range are tracked with monotonic deques, which makes both
+    `append()` (amortised) and reading `hv`/`hr` constant time.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._dates = [None] * capacity
+        self._open = array('d', bytes(8 * capacity))
+        self._high = array('d', bytes(8 * capacity))
+        self._low = array('d', bytes(8 * capacity))
+        self._close = array('d', bytes(8 * capacity))
+        self._range = array('d', bytes(8 * capacity))
+        self._volume = array('q', bytes(8 * capacity))
+        self._next = 0
+        # (sequence number, value) pairs with strictly decreasing values
+        self._volume_max = deque()
+        self._range_max = deque()
+
+    def __len__(self):
+        return min(self._next, self.capacity)
+
+    @staticmethod
+    def _push_max(window, seq, value, oldest):
+        while window and window[-1][1] <= value:
+            window.pop()
+        window.append((seq, value))
+        while window[0][0] < oldest:
+            window.popleft()
+
+    def append(self, date, open, high, low, close, volume):
+        seq = self._next
+        i = seq % self.capacity
+        self._dates[i] = date
+        self._open[i] = open
+        self._high[i] = high
+        self._low[i] = low
+        self._close[i] = close
+        self._range[i] = high - low
+        self._volume[i] = volume
+        self._next = seq + 1
+        oldest = self._next - self.capacity
+        self._push_max(self._volume_max, seq, volume, oldest)
+        self._push_max(self._range_max, seq, high - low, oldest)
+
+    def append_candle(self, candle):
+        self.append(candle['date'], candle['open'], candle['high'], candle['low'], candle['close'], candle['volume'])
+
+    @property
+    def hv(self):
+        """Highest volume in the window"""
+        return self._volume_max[0][1] if self._volume_max else 0
+
+    @property
+    def hr(self):
+        """Highest high-low range in the window"""
+        return self._range_max[0][1] if self._range_max else 0
+
+    def __getitem__(self, index):
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("candle index out of range")
+        i = (self._next - size + index) % self.capacity
+        return {'date': self._dates[i], 'open': self._open[i], 'high': self._high[i], 'low': self._low[i],
+                'close': self._close[i], 'volume': self._volume[i], 'range': self._range[i]}
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def to_list(self):
+        return list(self)
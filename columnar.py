@@ -0,0 +1,48 @@
+"""Struct-of-arrays candle results for KiteApp.historical_data(columnar=True).
+
+Needs numpy, which is only imported when a columnar result is requested.
+Dates are exchange-local (IST) wall-clock times as naive datetime64[s].
+"""
+
+IST_OFFSET_SECONDS = 19800
+FIELDS = ("open", "high", "low", "close", "volume", "oi")
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("historical_data(columnar=True) requires numpy (pip install numpy)")
+    return numpy
+
+
+def _columns(np, dates, values):
+    columns = {"date": dates}
+    for index, name in enumerate(FIELDS[:values.shape[1]]):
+        column = values[:, index]
+        columns[name] = column.astype(np.int64) if name in ("volume", "oi") else column
+    return columns
+
+
+def candles_to_columns(candles):
+    """Columns straight from the broker's JSON candle lists, with no per-row dicts"""
+    np = _numpy()
+    if not candles:
+        return _columns(np, np.array([], dtype="datetime64[s]"), np.empty((0, 5)))
+    # "2024-07-04T09:15:00+0530" -> the local wall-clock part numpy can parse
+    dates = np.array([c[0][:19] for c in candles], dtype="datetime64[s]")
+    values = np.array([c[1:] for c in candles], dtype=np.float64)
+    return _columns(np, dates, values)
+
+
+def rows_to_columns(rows):
+    """Columns from CandleStore rows of (epoch, open, high, low, close, volume, oi)"""
+    np = _numpy()
+    if not rows:
+        return _columns(np, np.array([], dtype="datetime64[s]"), np.empty((0, 5)))
+    values = np.array([[np.nan if v is None else v for v in row] for row in rows], dtype=np.float64)
+    dates = (values[:, 0].astype(np.int64) + IST_OFFSET_SECONDS).astype("datetime64[s]")
+    values = values[:, 1:]
+    if np.isnan(values[:, 5]).all():
+        values = values[:, :5]
+    return _columns(np, dates, values)
@@ -0,0 +1,68 @@
+import json
+import time
+import threading
+
+
+def _json_default(value):
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def format_sse(event, data, event_id=None):
+    """Encode one Server-Sent Events message"""
+    message = f"event: {event}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    return message + f"data: {json.dumps(data, default=_json_default)}\n\n"
+
+
+class EventBroadcaster:
+    """Fan out named events to any number of SSE subscribers.
+
+    Only the latest payload of each event type is kept, so a slow client
+    skips straight to the newest value instead of queueing stale ticks.
+    """
+
+    def __init__(self):
+        self.seq = 0
+        self.clients = 0
+        self._latest = {}
+        self._cond = threading.Condition()
+
+    def publish(self, event, data):
+        with self._cond:
+            self.seq += 1
+            self._latest[event] = (self.seq, data)
+            self._cond.notify_all()
+
+    def last_seq(self, event):
+        """Sequence number of the latest `event` payload, 0 if none was published"""
+        with self._cond:
+            return self._latest.get(event, (0, None))[0]
+
+    def subscribe(self, heartbeat=15, max_duration=300):
+        """Generator of SSE messages for one client.
+
+        Starts with the latest value of every event, then streams changes.
+        A comment line goes out every `heartbeat` seconds to keep proxies
+        from closing the connection, and the stream ends after
+        `max_duration` seconds so the browser reconnects and frees the
+        worker thread.
+        """
+        with self._cond:
+            self.clients += 1
+        try:
+            last = 0
+            deadline = time.time() + max_duration
+            yield "retry: 3000\n\n"
+            while time.time() < deadline:
+                with self._cond:
+                    self._cond.wait_for(lambda: self.seq > last, heartbeat)
+                    pending = sorted((seq, event, data) for event, (seq, data) in self._latest.items() if seq > last)
+                    last = self.seq
+                if not pending:
+                    yield ": keep-alive\n\n"
+                for seq, event, data in pending:
+                    yield format_sse(event, data, seq)
+        finally:
+            with self._cond:
+                self.clients -= 1
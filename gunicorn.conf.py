@@ -1,10 +1,16 @@
 # Gunicorn configuration file
 bind = "0.0.0.0:10000"
 workers = 2
-worker_class = "sync"
+worker_class = "gthread"
+threads = 32  # each /api/stream client holds a thread
 worker_connections = 1000
 timeout = 30
 keepalive = 2
 max_requests = 1000
 max_requests_jitter = 50
-preload_app = True 
\ No newline at end of file
+preload_app = True 
+
+def post_worker_init(worker):
+    # Start this worker's warm-up and background loops right away instead of on its first request
+    import web_app
+    web_app.start_background()
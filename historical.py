@@ -0,0 +1,87 @@
+from datetime import datetime, date, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import dateutil.parser
+
+from kite_trade import BulkResult
+
+# Longest date range the broker serves in one historical request, per interval
+MAX_DAYS = {
+    "minute": 60,
+    "3minute": 100,
+    "5minute": 100,
+    "10minute": 100,
+    "15minute": 200,
+    "30minute": 200,
+    "60minute": 400,
+    "day": 2000,
+}
+
+
+def _to_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return dateutil.parser.parse(value)
+
+
+def split_range(from_date, to_date, interval):
+    """Split [from_date, to_date] into the fewest windows the broker accepts.
+
+    Consecutive windows share their boundary timestamp, the downloader drops
+    the duplicate candle when stitching.
+    """
+    start, end = _to_datetime(from_date), _to_datetime(to_date)
+    step = timedelta(days=MAX_DAYS[interval])
+    windows = []
+    while start < end:
+        stop = min(start + step, end)
+        windows.append((start, stop))
+        start = stop
+    return windows or [(start, end)]
+
+
+class HistoricalDownloader:
+    """Fetches long histories for many instruments in parallel.
+
+    Every (instrument, window) pair is one task on a thread pool; the
+    KiteApp's request scheduler keeps them within the historical rate limit.
+    """
+
+    def __init__(self, kite, max_workers=3):
+        self.kite = kite
+        self.max_workers = max_workers
+
+    def _fetch(self, token, window, interval, continuous, oi):
+        start, stop = window
+        return self.kite.historical_data(token, start.strftime("%Y-%m-%d %H:%M:%S"), stop.strftime("%Y-%m-%d %H:%M:%S"),
+                                         interval, continuous, oi)
+
+    def download(self, instrument_tokens, from_date, to_date, interval, continuous=False, oi=False):
+        """Candles for each token over the whole range, as a BulkResult.
+
+        `result.data` maps instrument token to its stitched candle list;
+        windows that failed are listed in `result.errors` with their range.
+        """
+        if isinstance(instrument_tokens, (int, str)):
+            instrument_tokens = [instrument_tokens]
+        windows = split_range(from_date, to_date, interval)
+        result = BulkResult()
+        tasks = [(token, window) for token in instrument_tokens for window in windows]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [(token, window, pool.submit(self._fetch, token, window, interval, continuous, oi))
+                       for token, window in tasks]
+            for token, window, future in futures:
+                records = result.data.setdefault(token, [])
+                try:
+                    candles = future.result()
+                except Exception as e:
+                    result.errors.append({"instrument_token": token, "from": window[0], "to": window[1],
+                                          "error": str(e)})
+                    continue
+                # Results are read in submission order, so windows stitch in order; drop the
+                # boundary candle already taken from the previous window
+                last = records[-1]["date"] if records else None
+                records.extend(candle for candle in candles if last is None or candle["date"] > last)
+        return result
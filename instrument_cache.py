@@ -0,0 +1,278 @@
+import os
+import io
+import csv
+import json
+import mmap
+import re
+from array import array
+from datetime import datetime, timedelta, date
+
+from timestamps import parse_date
+
+CACHE_DIR = os.getenv("KITE_CACHE_DIR", ".kite_cache")
+MAGIC = b"KITEIM01"
+# First columns of the dump's header row; anything else (an error page or JSON) is not a dump
+CSV_HEADER = "instrument_token,exchange_token,tradingsymbol"
+CACHE_FILE = re.compile(r"instruments-(\d{8})\.bin$")
+
+# Column layout of the instrument dump, in the order the broker sends it.
+# Numeric columns are stored as native arrays, text columns as an offsets
+# array plus one utf-8 blob.
+NUMERIC_COLUMNS = {
+    "instrument_token": "q",
+    "last_price": "d",
+    "expiry": "i",  # date ordinal, 0 when the instrument has no expiry
+    "strike": "d",
+    "tick_size": "d",
+    "lot_size": "q",
+}
+TEXT_COLUMNS = ("exchange_token", "tradingsymbol", "name", "instrument_type", "segment", "exchange")
+
+
+def get_ist_date():
+    """Current trading date in IST (UTC + 5:30)"""
+    return (datetime.utcnow() + timedelta(hours=5, minutes=30)).date()
+
+
+def cache_path(day=None, cache_dir=None):
+    day = day or get_ist_date()
+    return os.path.join(cache_dir or CACHE_DIR, f"instruments-{day.strftime('%Y%m%d')}.bin")
+
+
+def is_fresh(day=None, cache_dir=None):
+    """Cheap freshness check: today's cache file exists (one stat, no read)"""
+    return os.path.exists(cache_path(day, cache_dir))
+
+
+def _parse_expiry(value):
+    return parse_date(value).toordinal() if value else 0
+
+
+def _pad(buf):
+    buf.write(b"\0" * (-buf.tell() % 8))
+
+
+def build_cache(csv_text, day=None, cache_dir=None):
+    """Convert the raw instrument CSV into the columnar cache file for `day`.
+
+    The file is written to a temporary name and renamed into place so that
+    concurrent readers never see a half written cache. Raises ValueError,
+    without touching the cache, when the text is not an instrument dump or
+    has no instruments, so an error response never replaces a good file.
+    """
+    if not csv_text.lstrip().startswith(CSV_HEADER):
+        raise ValueError(f"Not an instrument dump: {csv_text[:80]!r}")
+    numeric = {name: array(code) for name, code in NUMERIC_COLUMNS.items()}
+    text = {name: [] for name in TEXT_COLUMNS}
+
+    reader = csv.reader(io.StringIO(csv_text))
+    next(reader, None)
+    for row in reader:
+        if len(row) < 12:
+            continue
+        numeric["instrument_token"].append(int(row[0]))
+        text["exchange_token"].append(row[1])
+        text["tradingsymbol"].append(row[2])
+        text["name"].append(row[3])
+        numeric["last_price"].append(float(row[4]))
+        numeric["expiry"].append(_parse_expiry(row[5]))
+        numeric["strike"].append(float(row[6]))
+        numeric["tick_size"].append(float(row[7]))
+        numeric["lot_size"].append(int(row[8]))
+        text["instrument_type"].append(row[9])
+        text["segment"].append(row[10])
+        text["exchange"].append(row[11])
+
+    count = len(numeric["instrument_token"])
+    if not count:
+        raise ValueError("Instrument dump has no rows")
+    body = io.BytesIO()
+    columns = {}
+    for name, values in numeric.items():
+        columns[name] = {"type": values.typecode, "offset": body.tell()}
+        body.write(values.tobytes())
+        _pad(body)
+    for name, values in text.items():
+        encoded = [v.encode("utf-8") for v in values]
+        offsets = array("I", [0])
+        total = 0
+        for v in encoded:
+            total += len(v)
+            offsets.append(total)
+        columns[name] = {"type": "str", "offset": body.tell()}
+        body.write(offsets.tobytes())
+        _pad(body)
+        columns[name]["data"] = body.tell()
+        body.write(b"".join(encoded))
+        _pad(body)
+
+    day = day or get_ist_date()
+    header = json.dumps({"date": day.isoformat(), "count": count, "columns": columns}).encode("utf-8")
+    header += b" " * (-(len(MAGIC) + 4 + len(header)) % 8)
+
+    path = cache_path(day, cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(4, "little"))
+        f.write(header)
+        f.write(body.getbuffer())
+    os.replace(tmp, path)
+    _prune(path)
+    return path
+
+
+def _prune(keep):
+    """Remove cache files from previous days.
+
+    Only finished .bin files dated before `keep` are removed; another
+    process's in-flight .tmp file (or a newer day's cache) is left alone.
+    """
+    folder = os.path.dirname(keep)
+    keep_day = CACHE_FILE.match(os.path.basename(keep)).group(1)
+    for name in os.listdir(folder):
+        match = CACHE_FILE.match(name)
+        if match and match.group(1) < keep_day:
+            path = os.path.join(folder, name)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class InstrumentMaster:
+    """Read-only, memory-mapped view of one day's instrument master.
+
+    Every process mapping the same file shares its pages, and opening it
+    costs a header parse instead of a CSV parse.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mmap)
+        if bytes(buf[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not an instrument cache file")
+        size = int.from_bytes(buf[len(MAGIC):len(MAGIC) + 4], "little")
+        start = len(MAGIC) + 4
+        header = json.loads(bytes(buf[start:start + size]))
+        base = start + size
+
+        self.date = date.fromisoformat(header["date"])
+        self.count = header["count"]
+        self._numeric = {}
+        self._offsets = {}
+        self._blobs = {}
+        for name, col in header["columns"].items():
+            offset = base + col["offset"]
+            if col["type"] == "str":
+                self._offsets[name] = buf[offset:offset + 4 * (self.count + 1)].cast("I")
+                self._blobs[name] = buf[base + col["data"]:]
+            else:
+                width = array(col["type"]).itemsize
+                self._numeric[name] = buf[offset:offset + width * self.count].cast(col["type"])
+
+    def __len__(self):
+        return self.count
+
+    def column(self, name):
+        """Numeric columns come back as a zero-copy memoryview, text as a list"""
+        if name in self._numeric:
+            return self._numeric[name]
+        return [self.text(name, i) for i in range(self.count)]
+
+    def text(self, name, i):
+        offsets = self._offsets[name]
+        return str(self._blobs[name][offsets[i]:offsets[i + 1]], "utf-8")
+
+    def row(self, i):
+        expiry = self._numeric["expiry"][i]
+        return {'instrument_token': self._numeric["instrument_token"][i],
+                'exchange_token': self.text("exchange_token", i),
+                'tradingsymbol': self.text("tradingsymbol", i),
+                'name': self.text("name", i),
+                'last_price': self._numeric["last_price"][i],
+                'expiry': date.fromordinal(expiry) if expiry else None,
+                'strike': self._numeric["strike"][i],
+                'tick_size': self._numeric["tick_size"][i],
+                'lot_size': self._numeric["lot_size"][i],
+                'instrument_type': self.text("instrument_type", i),
+                'segment': self.text("segment", i),
+                'exchange': self.text("exchange", i)}
+
+    def rows(self, exchange=None):
+        for i in range(self.count):
+            if exchange is None or self.text("exchange", i) == exchange:
+                yield self.row(i)
+
+
+def load(day=None, cache_dir=None):
+    """Open the cache for `day` (default today), or None when it is missing"""
+    path = cache_path(day, cache_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        return InstrumentMaster(path)
+    except (ValueError, OSError) as e:
+        print(f"Ignoring unreadable instrument cache {path}: {e}")
+        return None
+
+
+def load_latest(cache_dir=None):
+    """Open the newest cache file of any day, or None when there is none"""
+    folder = cache_dir or CACHE_DIR
+    try:
+        names = sorted((name for name in os.listdir(folder) if CACHE_FILE.match(name)), reverse=True)
+    except FileNotFoundError:
+        return None
+    for name in names:
+        try:
+            return InstrumentMaster(os.path.join(folder, name))
+        except (ValueError, OSError) as e:
+            print(f"Ignoring unreadable instrument cache {name}: {e}")
+    return None
+
+
+class InstrumentIndex:
+    """Hash index over an InstrumentMaster.
+
+    Maps "EXCHANGE:TRADINGSYMBOL" and instrument tokens to row numbers, so
+    lookups are a dict hit and never touch the network.
+    """
+
+    def __init__(self, master):
+        self.master = master
+        self.date = master.date
+        tokens = master.column("instrument_token")
+        exchanges = master.column("exchange")
+        symbols = master.column("tradingsymbol")
+        self._by_symbol = {f"{exchanges[i]}:{symbols[i]}": i for i in range(len(master))}
+        self._by_token = {tokens[i]: i for i in range(len(master))}
+
+    def __len__(self):
+        return len(self._by_symbol)
+
+    def __contains__(self, symbol):
+        return symbol in self._by_symbol
+
+    def token(self, symbol):
+        """Instrument token for "EXCHANGE:TRADINGSYMBOL", or None"""
+        i = self._by_symbol.get(symbol)
+        return None if i is None else self.master.column("instrument_token")[i]
+
+    def instrument(self, token):
+        """Full instrument row for a token, or None"""
+        i = self._by_token.get(int(token))
+        return None if i is None else self.master.row(i)
+
+    def resolve(self, symbols):
+        """Bulk lookup: {symbol: token or None} for every symbol given"""
+        tokens = self.master.column("instrument_token")
+        by_symbol = self._by_symbol
+        result = {}
+        for symbol in symbols:
+            i = by_symbol.get(symbol)
+            result[symbol] = None if i is None else tokens[i]
+        return result
@@ -0,0 +1,363 @@
+import os
+import json
+import time
+import base64
+import struct
+import socket
+import hashlib
+import threading
+from urllib.parse import quote_plus
+try:
+    import websocket
+except ImportError:
+    os.system('python -m pip install websocket-client')
+    import websocket
+
+# Packet layouts of the broker's binary ticker protocol (all big-endian int32)
+_COUNT = struct.Struct(">H")
+_LTP = struct.Struct(">ii")                 # token, ltp
+_INDEX = struct.Struct(">6i")               # token, ltp, high, low, open, close
+_INT = struct.Struct(">i")
+_QUOTE = struct.Struct(">11i")              # token, ltp, qty, avg, volume, buy qty, sell qty, o, h, l, c
+_FULL_EXTRA = struct.Struct(">5i")          # last trade time, oi, oi high, oi low, exchange timestamp
+_DEPTH = struct.Struct(">iih2x")            # quantity, price, orders
+
+SEGMENT_CDS = 3
+SEGMENT_BCD = 6
+SEGMENT_INDICES = 9
+
+
+def _divisor(token):
+    segment = token & 0xff
+    if segment == SEGMENT_CDS:
+        return 10000000.0
+    if segment == SEGMENT_BCD:
+        return 10000.0
+    return 100.0
+
+
+class Tick:
+    """One decoded tick. Fields a mode does not carry are left as None"""
+    __slots__ = ("mode", "instrument_token", "tradable", "last_price", "last_quantity", "average_price",
+                 "volume", "buy_quantity", "sell_quantity", "open", "high", "low", "close", "change",
+                 "last_trade_time", "oi", "oi_day_high", "oi_day_low", "exchange_timestamp", "depth")
+
+    def __init__(self, mode, instrument_token, last_price):
+        self.mode = mode
+        self.instrument_token = instrument_token
+        self.tradable = (instrument_token & 0xff) != SEGMENT_INDICES
+        self.last_price = last_price
+        self.last_quantity = self.average_price = self.volume = None
+        self.buy_quantity = self.sell_quantity = None
+        self.open = self.high = self.low = self.close = self.change = None
+        self.last_trade_time = self.oi = self.oi_day_high = self.oi_day_low = None
+        self.exchange_timestamp = self.depth = None
+
+    def __repr__(self):
+        return f"Tick({self.mode}, {self.instrument_token}, {self.last_price})"
+
+
+def _set_ohlc(tick, o, h, l, c, d):
+    tick.open, tick.high, tick.low, tick.close = o / d, h / d, l / d, c / d
+    tick.change = (tick.last_price - tick.close) * 100 / tick.close if c else 0.0
+
+
+def parse_packet(buf, offset, length):
+    """Decode one packet of `length` bytes at `offset` of a memoryview"""
+    token, ltp = _LTP.unpack_from(buf, offset)
+    d = _divisor(token)
+    if length == 8:
+        return Tick(KiteTicker.MODE_LTP, token, ltp / d)
+
+    if (token & 0xff) == SEGMENT_INDICES:
+        _, _, h, l, o, c = _INDEX.unpack_from(buf, offset)
+        tick = Tick(KiteTicker.MODE_QUOTE if length == 28 else KiteTicker.MODE_FULL, token, ltp / d)
+        _set_ohlc(tick, o, h, l, c, d)
+        if length == 32:
+            tick.exchange_timestamp = _INT.unpack_from(buf, offset + 28)[0]
+        return tick
+
+    _, _, qty, avg, volume, buy, sell, o, h, l, c = _QUOTE.unpack_from(buf, offset)
+    tick = Tick(KiteTicker.MODE_QUOTE if length == 44 else KiteTicker.MODE_FULL, token, ltp / d)
+    tick.last_quantity, tick.average_price, tick.volume = qty, avg / d, volume
+    tick.buy_quantity, tick.sell_quantity = buy, sell
+    _set_ohlc(tick, o, h, l, c, d)
+    if length == 184:
+        (tick.last_trade_time, tick.oi, tick.oi_day_high, tick.oi_day_low,
+         tick.exchange_timestamp) = _FULL_EXTRA.unpack_from(buf, offset + 44)
+        depth = []
+        for pos in range(offset + 64, offset + 184, 12):
+            quantity, price, orders = _DEPTH.unpack_from(buf, pos)
+            depth.append((quantity, price / d, orders))
+        # First five levels are bids, the last five asks
+        tick.depth = (tuple(depth[:5]), tuple(depth[5:]))
+    return tick
+
+
+def parse_binary(data):
+    """Decode one binary ticker message into a list of Tick records.
+
+    Works on a memoryview of the frame, so packets are unpacked in place
+    without slicing copies. One byte messages are heartbeats.
+    """
+    if len(data) < 2:
+        return []
+    buf = memoryview(data)
+    count = _COUNT.unpack_from(buf, 0)[0]
+    offset = 2
+    ticks = []
+    for _ in range(count):
+        length = _COUNT.unpack_from(buf, offset)[0]
+        offset += 2
+        ticks.append(parse_packet(buf, offset, length))
+        offset += length
+    return ticks
+
+
+def build_message(packets):
+    """Frame raw packets the way the ticker does (used to make recordings)"""
+    parts = [_COUNT.pack(len(packets))]
+    for packet in packets:
+        parts.append(_COUNT.pack(len(packet)))
+        parts.append(packet)
+    return b"".join(parts)
+
+
+def write_recording(path, messages):
+    """Store binary ticker messages as length-prefixed records"""
+    with open(path, "ab") as f:
+        for message in messages:
+            f.write(len(message).to_bytes(4, "big"))
+            f.write(message)
+
+
+def read_recording(path):
+    messages = []
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = 0
+    while offset + 4 <= len(data):
+        size = int.from_bytes(data[offset:offset + 4], "big")
+        messages.append(data[offset + 4:offset + 4 + size])
+        offset += 4 + size
+    return messages
+
+
+class KiteTicker:
+    """Streaming tick client for the broker's binary WebSocket ticker.
+
+    Subscriptions are remembered and replayed after every reconnect.
+    `on_ticks(ticks)` is called from the socket thread with a list of Tick
+    records per message.
+    """
+    MODE_LTP = "ltp"
+    MODE_QUOTE = "quote"
+    MODE_FULL = "full"
+
+    ROOT_URI = "wss://ws.zerodha.com"
+    # Broker limit per connection, and how many tokens go in one control message
+    MAX_TOKENS = 3000
+    CHUNK_SIZE = 500
+
+    def __init__(self, enctoken, user_id, url=None, on_ticks=None, on_order_update=None, record_path=None):
+        self.enctoken = enctoken
+        self.user_id = user_id
+        self.url = url or (f"{self.ROOT_URI}/?api_key=kitefront&user_id={user_id}"
+                           f"&enctoken={quote_plus(enctoken)}&uid={int(time.time() * 1000)}"
+                           f"&user-agent=kite3-web&version=3.0.0")
+        self.on_ticks = on_ticks
+        self.on_order_update = on_order_update
+        self.record_path = record_path
+        self.subscriptions = {}
+        self.tick_count = 0
+        self._ws = None
+        self._thread = None
+        self._connected = threading.Event()
+        self._lock = threading.Lock()
+
+    def connect(self, wait=True, timeout=10):
+        self._ws = websocket.WebSocketApp(self.url, on_open=self._on_open, on_message=self._on_message,
+                                          on_error=self._on_error, on_close=self._on_close)
+        self._thread = threading.Thread(target=self._ws.run_forever, kwargs={"ping_interval": 30, "reconnect": 5},
+                                        name="kite-ticker", daemon=True)
+        self._thread.start()
+        if wait:
+            self._connected.wait(timeout)
+        return self._connected.is_set()
+
+    def close(self):
+        if self._ws is not None:
+            self._ws.keep_running = False
+            self._ws.close()
+        self._connected.clear()
+
+    def is_connected(self):
+        return self._connected.is_set()
+
+    def subscribe(self, tokens, mode=MODE_QUOTE):
+        tokens = [int(t) for t in tokens]
+        with self._lock:
+            new = [t for t in tokens if t not in self.subscriptions]
+            if len(self.subscriptions) + len(new) > self.MAX_TOKENS:
+                raise ValueError(f"A connection can subscribe at most {self.MAX_TOKENS} tokens")
+            for t in tokens:
+                self.subscriptions[t] = mode
+        if self.is_connected():
+            self._send_subscriptions(tokens, mode)
+
+    def unsubscribe(self, tokens):
+        tokens = [int(t) for t in tokens]
+        with self._lock:
+            for t in tokens:
+                self.subscriptions.pop(t, None)
+        if self.is_connected():
+            for chunk in self._chunks(tokens):
+                self._send({"a": "unsubscribe", "v": chunk})
+
+    def set_mode(self, tokens, mode):
+        self.subscribe(tokens, mode)
+
+    def _chunks(self, tokens):
+        for i in range(0, len(tokens), self.CHUNK_SIZE):
+            yield tokens[i:i + self.CHUNK_SIZE]
+
+    def _send(self, message):
+        self._ws.send(json.dumps(message))
+
+    def _send_subscriptions(self, tokens, mode):
+        for chunk in self._chunks(tokens):
+            self._send({"a": "subscribe", "v": chunk})
+            self._send({"a": "mode", "v": [mode, chunk]})
+
+    def _on_open(self, ws):
+        self._connected.set()
+        with self._lock:
+            by_mode = {}
+            for token, mode in self.subscriptions.items():
+                by_mode.setdefault(mode, []).append(token)
+        for mode, tokens in by_mode.items():
+            self._send_subscriptions(tokens, mode)
+
+    def _on_message(self, ws, message):
+        if isinstance(message, str):
+            data = json.loads(message)
+            if data.get("type") == "order" and self.on_order_update:
+                self.on_order_update(data.get("data"))
+            elif data.get("type") == "error":
+                print(f"Ticker error: {data.get('data')}")
+            return
+        if self.record_path and len(message) > 1:
+            write_recording(self.record_path, [message])
+        ticks = parse_binary(message)
+        if ticks:
+            self.tick_count += len(ticks)
+            if self.on_ticks:
+                self.on_ticks(ticks)
+
+    def _on_error(self, ws, error):
+        print(f"Ticker connection error: {error}")
+
+    def _on_close(self, ws, status, reason):
+        self._connected.clear()
+
+
+class ReplayServer:
+    """Local stand-in for the ticker WebSocket that replays recorded messages.
+
+    Speaks just enough of RFC 6455 for KiteTicker: the handshake, unmasking
+    client text frames (kept in `received`) and sending binary frames. The
+    replay starts once the client sends its first subscribe message.
+    """
+
+    _GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+    def __init__(self, messages, host="127.0.0.1", port=0, interval=0.0):
+        self.messages = list(messages)
+        self.interval = interval
+        self.received = []
+        self._stopped = threading.Event()
+        self._sock = socket.create_server((host, port))
+        self.host, self.port = self._sock.getsockname()[:2]
+        self.url = f"ws://{self.host}:{self.port}/"
+        self._thread = threading.Thread(target=self._serve, name="ticker-replay", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._sock.close()
+
+    def _serve(self):
+        try:
+            conn, _ = self._sock.accept()
+        except OSError:
+            return
+        with conn:
+            request = b""
+            while b"\r\n\r\n" not in request:
+                request += conn.recv(4096)
+            key = ""
+            for line in request.decode("latin-1").split("\r\n"):
+                if line.lower().startswith("sec-websocket-key:"):
+                    key = line.split(":", 1)[1].strip()
+            accept = base64.b64encode(hashlib.sha1((key + self._GUID).encode()).digest()).decode()
+            conn.sendall(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                          f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+
+            subscribed = threading.Event()
+            threading.Thread(target=self._read_frames, args=(conn, subscribed), daemon=True).start()
+            subscribed.wait(10)
+            try:
+                for message in self.messages:
+                    conn.sendall(self._frame(message))
+                    if self.interval:
+                        time.sleep(self.interval)
+                # Keep the connection open until the server is stopped
+                self._stopped.wait()
+            except OSError:
+                pass
+
+    @staticmethod
+    def _frame(payload, opcode=0x2):
+        size = len(payload)
+        if size < 126:
+            header = struct.pack(">BB", 0x80 | opcode, size)
+        elif size < 65536:
+            header = struct.pack(">BBH", 0x80 | opcode, 126, size)
+        else:
+            header = struct.pack(">BBQ", 0x80 | opcode, 127, size)
+        return header + payload
+
+    @staticmethod
+    def _recv_exact(conn, size):
+        data = b""
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise OSError("connection closed")
+            data += chunk
+        return data
+
+    def _read_frames(self, conn, subscribed):
+        try:
+            while True:
+                b1, b2 = self._recv_exact(conn, 2)
+                opcode, size = b1 & 0x0f, b2 & 0x7f
+                if size == 126:
+                    size = struct.unpack(">H", self._recv_exact(conn, 2))[0]
+                elif size == 127:
+                    size = struct.unpack(">Q", self._recv_exact(conn, 8))[0]
+                mask = self._recv_exact(conn, 4) if b2 & 0x80 else b"\0\0\0\0"
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(self._recv_exact(conn, size)))
+                if opcode == 0x8:
+                    conn.sendall(self._frame(payload[:2], 0x8))
+                    return
+                if opcode == 0x9:
+                    conn.sendall(self._frame(payload, 0xA))
+                elif opcode == 0x1:
+                    self.received.append(json.loads(payload))
+                    subscribed.set()
+        except OSError:
+            subscribed.set()
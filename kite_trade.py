@@ -9,11 +9,19 @@ except ImportError:
     os.system('python -m pip install python-dateutil')
 
 import requests
-import dateutil.parser
+import transport
+from concurrent.futures import ThreadPoolExecutor
+from timestamps import parse_timestamp
+import instrument_cache
+import candle_store
+import columnar as columnar_candles
+from ratelimit import RequestScheduler
+from metrics import json_body
+from token_store import config_store
 
 
-def get_enctoken(userid, password, twofa):
-    session = requests.Session()
+def get_enctoken(userid, password, twofa, save=True):
+    session = transport.new_session()
     response = session.post('https://kite.zerodha.com/api/login', data={
         "user_id": userid,
         "password": password
@@ -24,13 +32,9 @@ def get_enctoken(userid, password, twofa):
         "user_id": response.json()['data']['user_id']
     })
     enctoken = response.cookies.get('enctoken')
-    if(response.cookies.get('enctoken')):
+    if save and response.cookies.get('enctoken'):
         et = response.cookies.get('enctoken')
-        with open("config.json", "r") as jsonFile:
-            data = json.load(jsonFile)
-        data["enctoken"] = et
-        with open("config.json", "w") as jsonFile:
-            json.dump(data, jsonFile)
+        config_store().set("enctoken", et)
         print(et)
 
     if enctoken:
@@ -39,6 +43,30 @@ def get_enctoken(userid, password, twofa):
         raise Exception("Enter valid details !!!!")
 
 
+def order_id_from(body, status_code=None):
+    """order_id from a decoded order response, raising with the broker's message on a rejection"""
+    data = body.get("data") if isinstance(body, dict) else None
+    if not isinstance(data, dict) or body.get("status") == "error" or "order_id" not in data:
+        message = body.get("message") if isinstance(body, dict) else None
+        raise Exception(message or f"Order request failed (HTTP {status_code}): {body!r:.200}")
+    return data["order_id"]
+
+
+class BulkResult:
+    """Merged response of a chunked request plus the chunks that failed"""
+
+    def __init__(self):
+        self.data = {}
+        self.errors = []
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def __repr__(self):
+        return f"BulkResult({len(self.data)} instruments, {len(self.errors)} failed chunks)"
+
+
 class KiteApp:
     # Products
     PRODUCT_MIS = "MIS"
@@ -73,7 +101,17 @@ class KiteApp:
     EXCHANGE_BFO = "BFO"
     EXCHANGE_MCX = "MCX"
 
-    def __init__(self, enctoken):
+    # Instruments accepted per request by the quote and ltp endpoints
+    QUOTE_CHUNK_SIZE = 500
+    LTP_CHUNK_SIZE = 1000
+
+    # Broker rate limits in requests per second, per endpoint class and overall
+    RATE_LIMITS = {"quote": 1, "historical": 3, "order": 10, "default": 10}
+    TOTAL_RATE_LIMIT = 10
+    # Lower runs first: order placement/modification jumps ahead of data requests
+    PRIORITIES = {"order": 0, "default": 1, "quote": 1, "historical": 2}
+
+    def __init__(self, enctoken, candle_store=None, root_url="https://kite.zerodha.com/oms", metrics=None, warm=True):
         # self.headers = {"Authorization": f"enctoken {enctoken}"}
         # self.session = requests.session()
         # # self.root_url = "https://api.kite.trade"
@@ -85,49 +123,171 @@ class KiteApp:
             "x-kite-version": "3",
             'Authorization': 'enctoken {}'.format(self.enctoken)
         }
-        self.session = requests.session()
+        self.session = transport.new_session()
         self.api_key = "kite"
         self.user_id = "KK7143"
         self.root2 = "https://kite.zerodha.com/oms"
-        self.root_url = "https://kite.zerodha.com/oms"
+        self.root_url = root_url
+        self.scheduler = RequestScheduler(self.RATE_LIMITS, total_rate=self.TOTAL_RATE_LIMIT,
+                                          priorities=self.PRIORITIES)
+        # Optional candle_store.CandleStore consulted before downloading history
+        self.candle_store = candle_store
+        # Optional metrics.ApiMetrics recording per-endpoint latency and payload sizes
+        self.metrics = metrics
 
-        self.session.get(self.root_url, headers=self.headers)
+        # warm=False skips the connection warm-up so construction does no network I/O
+        if warm:
+            self.warm_up()
         # KiteConnect.__init__(self, api_key="kite")
 
+    def warm_up(self):
+        """Open the keep-alive connection to the broker ahead of the first real call"""
+        self.session.get(self.root_url, headers=self.headers)
+
+    def set_enctoken(self, enctoken):
+        """Switch to a rotated enctoken without rebuilding the session"""
+        self.enctoken = enctoken
+        self.headers = dict(self.headers, Authorization='enctoken {}'.format(enctoken))
+
+    def _send(self, method, path, endpoint, label, decode=True, **kwargs):
+        """Send one API request once the scheduler grants `endpoint` a slot.
+
+        Returns (response, decoded JSON body); the body is None when it is
+        not JSON or decode=False. `label` names the call in metrics.
+        """
+        self.scheduler.acquire(endpoint)
+        send = lambda: self.session.request(method, f"{self.root_url}{path}", headers=self.headers, **kwargs)
+        if self.metrics is not None:
+            return self.metrics.measure(label, send, decode)
+        response = send()
+        return response, json_body(response) if decode else None
+
+    def _request(self, method, path, endpoint, label, **kwargs):
+        """Decoded JSON body of one API request, see _send()"""
+        response, data = self._send(method, path, endpoint, label, **kwargs)
+        if data is None:
+            raise ValueError(f"HTTP {response.status_code}: {response.text[:200]}")
+        return data
+
+    def instrument_master(self, refresh=False):
+        """Today's instrument master as a memory-mapped columnar cache.
+
+        The dump is downloaded at most once per day; later calls (from any
+        process sharing the cache directory) just map the cached file. If
+        the download fails (e.g. an expired enctoken) the newest existing
+        cache keeps being used instead.
+        """
+        master = None if refresh else instrument_cache.load()
+        if master is None:
+            try:
+                response, _ = self._send("get", "/instruments", "default", "instruments", decode=False)
+                response.raise_for_status()
+                instrument_cache.build_cache(response.text)
+            except Exception as e:
+                master = instrument_cache.load_latest()
+                if master is None:
+                    raise
+                print(f"Instrument master download failed ({e}), using cache from {master.date}")
+                return master
+            master = instrument_cache.load()
+        return master
+
     def instruments(self, exchange=None):
-        data = self.session.get(f"{self.root_url}/instruments",headers=self.headers).text.split("\n")
-        Exchange = []
-        for i in data[1:-1]:
-            row = i.split(",")
-            if exchange is None or exchange == row[11]:
-                Exchange.append({'instrument_token': int(row[0]), 'exchange_token': row[1], 'tradingsymbol': row[2],
-                                 'name': row[3][1:-1], 'last_price': float(row[4]),
-                                 'expiry': dateutil.parser.parse(row[5]).date() if row[5] != "" else None,
-                                 'strike': float(row[6]), 'tick_size': float(row[7]), 'lot_size': int(row[8]),
-                                 'instrument_type': row[9], 'segment': row[10],
-                                 'exchange': row[11]})
-        return Exchange
+        return list(self.instrument_master().rows(exchange))
+
+    def instrument_index(self, refresh=False):
+        """Symbol/token lookup index over today's instrument master"""
+        return instrument_cache.InstrumentIndex(self.instrument_master(refresh))
 
     def quote(self, instruments):
-        data = self.session.get(f"{self.root_url}/quote", params={"i": instruments}, headers=self.headers).json()["data"]
+        if not isinstance(instruments, str) and len(instruments) > self.QUOTE_CHUNK_SIZE:
+            return self.bulk_quote(instruments).data
+        data = self._request("get", "/quote", "quote", "quote", params={"i": instruments})["data"]
         return data
 
     def ltp(self, instruments):
-        data = self.session.get(f"{self.root_url}/quote/ltp", params={"i": instruments}, headers=self.headers).json()
+        if not isinstance(instruments, str) and len(instruments) > self.LTP_CHUNK_SIZE:
+            return {"status": "success", "data": self.bulk_ltp(instruments).data}
+        data = self._request("get", "/quote/ltp", "quote", "ltp", params={"i": instruments})
         return data
 
-    def historical_data(self, instrument_token, from_date, to_date, interval, continuous=False, oi=False):
+    def _bulk(self, path, instruments, chunk_size, max_workers):
+        """GET `path` for any number of instruments, split into maximal chunks.
+
+        Chunks run concurrently on a thread pool but each one waits its turn
+        in the request scheduler, so bursts stay within the broker limit. Failed
+        chunks are reported in the result instead of failing the whole call.
+        """
+        instruments = list(dict.fromkeys(instruments))
+        chunks = [instruments[i:i + chunk_size] for i in range(0, len(instruments), chunk_size)]
+        label = "quote" if path == "/quote" else "ltp"
+
+        def fetch(chunk):
+            response = self._request("get", path, "quote", label, params={"i": chunk})
+            if response.get("status") != "success":
+                raise Exception(response.get("message", "request failed"))
+            return response["data"]
+
+        result = BulkResult()
+        if not chunks:
+            return result
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as pool:
+            futures = [(chunk, pool.submit(fetch, chunk)) for chunk in chunks]
+            for chunk, future in futures:
+                try:
+                    result.data.update(future.result())
+                except Exception as e:
+                    result.errors.append({"instruments": chunk, "error": str(e)})
+        return result
+
+    def bulk_quote(self, instruments, max_workers=4):
+        """Full quotes for an arbitrarily long instrument list, as a BulkResult"""
+        return self._bulk("/quote", instruments, self.QUOTE_CHUNK_SIZE, max_workers)
+
+    def bulk_ltp(self, instruments, max_workers=4):
+        """LTPs for an arbitrarily long instrument list, as a BulkResult"""
+        return self._bulk("/quote/ltp", instruments, self.LTP_CHUNK_SIZE, max_workers)
+
+    def historical_data(self, instrument_token, from_date, to_date, interval, continuous=False, oi=False,
+                        columnar=False, refresh=False):
+        """Candles as a list of dicts, or with columnar=True a dict of numpy
+        arrays (date, open, high, low, close, volume[, oi]) built without
+        per-candle dicts. refresh=True downloads the whole range even when
+        the candle store has it, replacing the stored candles."""
+        store = self.candle_store
+        if store is None or continuous or oi:
+            if columnar:
+                return columnar_candles.candles_to_columns(
+                    self._historical_candles(instrument_token, from_date, to_date, interval, continuous, oi))
+            return self._historical_data(instrument_token, from_date, to_date, interval, continuous, oi)
+        # Serve what is stored locally and download only the ranges that are missing
+        if refresh:
+            missing = [(candle_store.to_epoch(from_date), candle_store.to_epoch(to_date))]
+        else:
+            missing = store.missing_ranges(instrument_token, interval, from_date, to_date)
+        for start, end in missing:
+            start, end = candle_store.format_epoch(start), candle_store.format_epoch(end)
+            store.write(instrument_token, interval,
+                        self._historical_data(instrument_token, start, end, interval), start, end)
+        if columnar:
+            return columnar_candles.rows_to_columns(store.rows(instrument_token, interval, from_date, to_date))
+        return store.read(instrument_token, interval, from_date, to_date)
+
+    def _historical_candles(self, instrument_token, from_date, to_date, interval, continuous=False, oi=False):
+        """Raw candle lists as the broker sends them"""
         params = {"from": from_date,
                   "to": to_date,
                   "interval": interval,
                   "continuous": 1 if continuous else 0,
                   "oi": 1 if oi else 0}
-        lst = self.session.get(
-            f"{self.root_url}/instruments/historical/{instrument_token}/{interval}", params=params,
-            headers=self.headers).json()["data"]["candles"]
+        return self._request("get", f"/instruments/historical/{instrument_token}/{interval}", "historical",
+                             "historical_data", params=params)["data"]["candles"]
+
+    def _historical_data(self, instrument_token, from_date, to_date, interval, continuous=False, oi=False):
+        lst = self._historical_candles(instrument_token, from_date, to_date, interval, continuous, oi)
         records = []
         for i in lst:
-            record = {"date": dateutil.parser.parse(i[0]), "open": i[1], "high": i[2], "low": i[3],
+            record = {"date": parse_timestamp(i[0]), "open": i[1], "high": i[2], "low": i[3],
                       "close": i[4], "volume": i[5],}
             if len(i) == 7:
                 record["oi"] = i[6]
@@ -135,26 +295,33 @@ class KiteApp:
         return records
 
     def margins(self):
-        margins = self.session.get(f"{self.root_url}/user/margins", headers=self.headers).json()["data"]
+        margins = self._request("get", "/user/margins", "default", "margins")["data"]
         return margins
     def profile(self):
-        profile = self.session.get(f"{self.root_url}/user/profile/full", headers=self.headers).json()["data"]
+        profile = self._request("get", "/user/profile/full", "default", "profile")["data"]
         return profile
     def orders(self):
-        orders = self.session.get(f"{self.root_url}/orders", headers=self.headers).json()["data"]
+        orders = self._request("get", "/orders", "default", "orders")["data"]
         return orders
 
     def positions(self):
-        positions = self.session.get(f"{self.root_url}/portfolio/positions", headers=self.headers).json()["data"]
+        positions = self._request("get", "/portfolio/positions", "default", "positions")["data"]
         return positions
     def profile(self):
-        profile = self.session.get(f"{self.root_url}/user/profile/full", headers=self.headers).json()["data"]
+        profile = self._request("get", "/user/profile/full", "default", "profile")["data"]
         return profile
     
     def holdings(self):
-        holdings = self.session.get(f"{self.root_url}/portfolio/holdings", headers=self.headers).json()["data"]
+        holdings = self._request("get", "/portfolio/holdings", "default", "holdings")["data"]
         return holdings
 
+    @staticmethod
+    def _order_id(response, body):
+        """order_id from an order response; raises with the broker's message when it was rejected"""
+        if body is None:
+            raise Exception(f"HTTP {response.status_code}: {response.text[:200]}")
+        return order_id_from(body, response.status_code)
+
     def place_order(self, variety, exchange, tradingsymbol, transaction_type, quantity, product, order_type, price=None,
                     validity=None, disclosed_quantity=None, trigger_price=None, squareoff=None, stoploss=None,
                     trailing_stoploss=None, tag=None):
@@ -163,9 +330,7 @@ class KiteApp:
         for k in list(params.keys()):
             if params[k] is None:
                 del params[k]
-        order_id = self.session.post(f"{self.root_url}/orders/{variety}",
-                                     data=params, headers=self.headers).json()["data"]["order_id"]
-        return order_id
+        return self._order_id(*self._send("post", f"/orders/{variety}", "order", "place_order", data=params))
 
     def modify_order(self, variety, order_id, parent_order_id=None, quantity=None, price=None, order_type=None,
                      trigger_price=None, validity=None, disclosed_quantity=None):
@@ -175,16 +340,11 @@ class KiteApp:
             if params[k] is None:
                 del params[k]
 
-        order_id = self.session.put(f"{self.root_url}/orders/{variety}/{order_id}",
-                                    data=params, headers=self.headers).json()["data"][
-            "order_id"]
-        return order_id
+        return self._order_id(*self._send("put", f"/orders/{variety}/{order_id}", "order", "modify_order", data=params))
 
     def cancel_order(self, variety, order_id, parent_order_id=None):
-        order_id = self.session.delete(f"{self.root_url}/orders/{variety}/{order_id}",
-                                       data={"parent_order_id": parent_order_id} if parent_order_id else {},
-                                       headers=self.headers).json()["data"]["order_id"]
-        return order_id
+        return self._order_id(*self._send("delete", f"/orders/{variety}/{order_id}", "order", "cancel_order",
+                                          data={"parent_order_id": parent_order_id} if parent_order_id else {}))
     
 
     def buy_equity(self, tradingsymbol, quantity,transaction_type,tag=None):
@@ -197,8 +357,7 @@ class KiteApp:
                      'order_type': 'MARKET', 
                      'tag': tag
                 }
-        reponse = self.session.post(f"{self.root_url}/orders/{variety}",
-                                     data=params, headers=self.headers).json()
+        reponse = self._request("post", f"/orders/{variety}", "order", "buy_equity", data=params)
         return reponse
 
     def buy(self, tradingsymbol, quantity,transaction_type,tag=None):
@@ -211,8 +370,7 @@ class KiteApp:
                      'order_type': 'MARKET', 
                      'tag': tag
                 }
-        reponse = self.session.post(f"{self.root_url}/orders/{variety}",
-                                     data=params, headers=self.headers).json()
+        reponse = self._request("post", f"/orders/{variety}", "order", "buy", data=params)
         return reponse
     def buy_limit(self, tradingsymbol, quantity,price,transaction_type,tag=None):
         variety='regular'
@@ -225,8 +383,7 @@ class KiteApp:
                         'order_type': 'LIMIT', 
                         'tag': tag
                 }
-        reponse = self.session.post(f"{self.root_url}/orders/{variety}",
-                                        data=params, headers=self.headers).json()
+        reponse = self._request("post", f"/orders/{variety}", "order", "buy_limit", data=params)
         return reponse
     
     def sell_target(self, tradingsymbol, quantity,price,tag=None):
@@ -240,7 +397,7 @@ class KiteApp:
                      'order_type': 'LIMIT', 
                      'tag': tag
                 }
-        reponse = self.session.post(f"{self.root_url}/orders/{variety}",data=params, headers=self.headers).json()
+        reponse = self._request("post", f"/orders/{variety}", "order", "sell_target", data=params)
         return reponse
     
     def sell_sl(self, tradingsymbol, quantity,price,trigger_price,tag=None):
@@ -255,7 +412,7 @@ class KiteApp:
                     'order_type': 'SL', 
                     'tag': tag
             }
-        reponse = self.session.post(f"{self.root_url}/orders/{variety}",data=params, headers=self.headers).json()
+        reponse = self._request("post", f"/orders/{variety}", "order", "sell_sl", data=params)
         return reponse
     
     def modify_order_exit(self, order_id, quantity):
@@ -264,6 +421,5 @@ class KiteApp:
                 'quantity':quantity,
                 'order_type':'MARKET',
                 'validity':'DAY'}
-        response = self.session.put(f"{self.root_url}/orders/{variety}/{order_id}",
-                                    data=params, headers=self.headers).json()
+        response = self._request("put", f"/orders/{variety}/{order_id}", "order", "modify_order_exit", data=params)
         return response
\ No newline at end of file
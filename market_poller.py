@@ -0,0 +1,92 @@
+import time
+import threading
+
+
+class QuoteSnapshot:
+    """One published result of a poll: quotes keyed by symbol plus bookkeeping"""
+    __slots__ = ("seq", "fetched_at", "quotes", "error")
+
+    def __init__(self, seq, fetched_at, quotes, error=None):
+        self.seq = seq
+        self.fetched_at = fetched_at
+        self.quotes = quotes
+        self.error = error
+
+    def age(self):
+        return time.time() - self.fetched_at if self.fetched_at else None
+
+
+class QuotePoller:
+    """Single owner of upstream quote traffic.
+
+    One background thread calls `fetch(symbols)` every `interval` seconds and
+    publishes the result as an immutable QuoteSnapshot. Readers (HTTP
+    handlers, the update loop) only ever look at the latest snapshot, so the
+    upstream call rate does not depend on how many clients are polling us.
+    """
+
+    def __init__(self, fetch, symbols=(), interval=1.0, should_poll=None):
+        self.fetch = fetch
+        self.interval = interval
+        self.should_poll = should_poll
+        self.symbols = list(symbols)
+        self.fetch_count = 0
+        self.error_count = 0
+        self._snapshot = QuoteSnapshot(0, 0, {})
+        self._cond = threading.Condition()
+        self._fetch_lock = threading.Lock()
+        self._thread = None
+
+    def set_symbols(self, symbols):
+        with self._cond:
+            self.symbols = list(symbols)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="quote-poller", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def _run(self):
+        while True:
+            started = time.time()
+            if self.should_poll is None or self.should_poll():
+                self.refresh()
+            time.sleep(max(0.0, self.interval - (time.time() - started)))
+
+    def refresh(self):
+        """Fetch right now and publish the result; returns the new snapshot"""
+        with self._fetch_lock:
+            symbols = list(self.symbols)
+            if not symbols:
+                return self._snapshot
+            quotes, error = None, None
+            try:
+                quotes = self.fetch(symbols)
+                self.fetch_count += 1
+            except Exception as e:
+                error = str(e)
+            if quotes is None:
+                self.error_count += 1
+                error = error or "no data returned"
+                print(f"Error polling quotes for {symbols}: {error}")
+            with self._cond:
+                previous = self._snapshot
+                # Keep serving the last good quotes if this poll failed
+                self._snapshot = QuoteSnapshot(previous.seq + 1, time.time() if quotes is not None else previous.fetched_at,
+                                               quotes if quotes is not None else previous.quotes, error)
+                self._cond.notify_all()
+                return self._snapshot
+
+    def latest(self):
+        return self._snapshot
+
+    def quote(self, symbol):
+        """Latest quote for one symbol, or None if it has not been seen yet"""
+        return self._snapshot.quotes.get(symbol)
+
+    def wait_for_update(self, seq, timeout=None):
+        """Block until a snapshot newer than `seq` is published (or timeout)"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._snapshot.seq > seq, timeout)
+            return self._snapshot
@@ -0,0 +1,196 @@
+import threading
+import time
+from bisect import bisect_left
+
+# Bucket upper bounds: seconds for latencies, bytes for payload sizes
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Histogram:
+    """Fixed-bucket histogram; counts[i] holds observations <= bounds[i], the last one the overflow"""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (None when empty or in the overflow)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return None
+
+    def snapshot(self):
+        return {"count": self.count, "sum": self.sum,
+                "avg": self.sum / self.count if self.count else None,
+                "p50": self.quantile(0.5), "p99": self.quantile(0.99),
+                "buckets": dict(zip(self.bounds + ("inf",), self.counts))}
+
+
+class EndpointStats:
+    __slots__ = ("network", "decode", "total", "size", "errors")
+
+    def __init__(self):
+        self.network = Histogram(LATENCY_BUCKETS)
+        self.decode = Histogram(LATENCY_BUCKETS)
+        self.total = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.errors = 0
+
+
+def json_body(response):
+    """A response's decoded JSON body, or None when it is not JSON"""
+    try:
+        return response.json()
+    except ValueError:
+        return None
+
+
+class ApiMetrics:
+    """Per-endpoint latency, payload size and error counters for KiteApp and the quote poller.
+
+    Attach one with `KiteApp(..., metrics=ApiMetrics())` (or set
+    `kite.metrics` later); with no metrics attached `_send` skips all of
+    this. `network` is the time until the response body is read, `decode`
+    the JSON parse, `total` both together (rate-limit wait excluded).
+    """
+
+    def __init__(self):
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, network, decode, size, error=False):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats()
+            stats.network.observe(network)
+            stats.decode.observe(decode)
+            stats.total.observe(network + decode)
+            stats.size.observe(size)
+            if error:
+                stats.errors += 1
+
+    def measure(self, endpoint, send, decode=True):
+        """Call `send()`, which returns a requests response, and record it.
+
+        Returns (response, decoded JSON body or None); decoding here times
+        the parse apart from the network.
+        """
+        start = time.perf_counter()
+        try:
+            response = send()
+            size = len(response.content)
+        except Exception:
+            self.record_error(endpoint, time.perf_counter() - start)
+            raise
+        received = time.perf_counter()
+        data = json_body(response) if decode else None
+        decoded = time.perf_counter()
+        error = response.status_code >= 400 or (isinstance(data, dict) and data.get("status") == "error")
+        self.record(endpoint, received - start, decoded - received, size, error)
+        return response, data
+
+    def record_error(self, endpoint, network):
+        """A request that raised before a response arrived"""
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats()
+            stats.network.observe(network)
+            stats.total.observe(network)
+            stats.errors += 1
+
+    def endpoints(self):
+        return sorted(self._endpoints)
+
+    def snapshot(self):
+        """{endpoint: {"requests", "errors", "network", "decode", "total", "size"}}"""
+        with self._lock:
+            return {name: {"requests": stats.total.count, "errors": stats.errors,
+                           "network": stats.network.snapshot(), "decode": stats.decode.snapshot(),
+                           "total": stats.total.snapshot(), "size": stats.size.snapshot()}
+                    for name, stats in self._endpoints.items()}
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+    def write_prometheus(self, writer, prefix="kite_api"):
+        # Samples of one metric must be contiguous, so write metric by metric
+        families = (("network", "network_seconds", "Time until the upstream response body was read"),
+                    ("decode", "decode_seconds", "JSON decode time of upstream responses"),
+                    ("total", "request_seconds", "Upstream network plus decode time"),
+                    ("size", "response_bytes", "Upstream response size"))
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            for attr, suffix, help_text in families:
+                for name, stats in endpoints:
+                    writer.histogram(f"{prefix}_{suffix}", getattr(stats, attr), {"endpoint": name}, help_text)
+            for name, stats in endpoints:
+                writer.counter(f"{prefix}_errors_total", stats.errors, {"endpoint": name}, "Failed upstream requests")
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+def _format_value(value):
+    if value is None:
+        return "NaN"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class PrometheusWriter:
+    """Builds a Prometheus text-format (0.0.4) exposition"""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._lines = []
+        self._described = set()
+
+    def _describe(self, name, kind, help_text):
+        if name not in self._described:
+            self._described.add(name)
+            if help_text:
+                self._lines.append(f"# HELP {name} {help_text}")
+            self._lines.append(f"# TYPE {name} {kind}")
+
+    def gauge(self, name, value, labels=None, help_text=None):
+        self._describe(name, "gauge", help_text)
+        self._lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    def counter(self, name, value, labels=None, help_text=None):
+        self._describe(name, "counter", help_text)
+        self._lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    def histogram(self, name, histogram, labels=None, help_text=None):
+        self._describe(name, "histogram", help_text)
+        labels = dict(labels or {})
+        cumulative = 0
+        for bound, n in zip(histogram.bounds + ("+Inf",), histogram.counts):
+            cumulative += n
+            self._lines.append(f"{name}_bucket{_format_labels(dict(labels, le=bound))} {cumulative}")
+        self._lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+        self._lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+    def text(self):
+        return "\n".join(self._lines) + "\n"
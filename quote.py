@@ -1,23 +1,44 @@
-import requests
-import json
+from transport import shared_session
+from token_store import config_store
+from metrics import json_body
 
-# Load API key and access token from config.json
-with open('config.json') as f:
-    config = json.load(f)
-api_key = config['kite_api_key']
-access_token = config['access_token']
+# API key and access token come from config.json through the token store, so a
+# rotated access token is used on the next call without a restart
+config = config_store()
 
-headers = {
-    'X-Kite-Version': '3',
-    'Authorization': f'token {api_key}:{access_token}'
-}
 
-def get_quote(instrument):
-    """Get quote data for a given instrument symbol, e.g. 'NSE:INFY'"""
-    url = f'https://api.kite.trade/quote?i={instrument}'
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        return response.json()['data']
+def auth_headers():
+    return {
+        'X-Kite-Version': '3',
+        'Authorization': f"token {config['kite_api_key']}:{config['access_token']}"
+    }
+
+# Instruments the quote endpoint accepts per request
+QUOTE_CHUNK_SIZE = 500
+
+def get_quote(instrument, metrics=None):
+    """Get quote data for a given instrument symbol, e.g. 'NSE:INFY', or a list of symbols.
+
+    With a metrics.ApiMetrics each request is recorded as "poller_quote".
+    """
+    if not isinstance(instrument, str) and len(instrument) > QUOTE_CHUNK_SIZE:
+        # Larger lists go out in maximal chunks and are merged
+        data = {}
+        for i in range(0, len(instrument), QUOTE_CHUNK_SIZE):
+            chunk = get_quote(instrument[i:i + QUOTE_CHUNK_SIZE], metrics)
+            if chunk is None:
+                return None
+            data.update(chunk)
+        return data
+    url = 'https://api.kite.trade/quote'
+    send = lambda: shared_session().get(url, params={'i': instrument}, headers=auth_headers())
+    if metrics is None:
+        response = send()
+        data = json_body(response)
+    else:
+        response, data = metrics.measure("poller_quote", send)
+    if response.status_code == 200 and data is not None:
+        return data['data']
     else:
         print('Error:', response.status_code, response.text)
         return None
@@ -0,0 +1,113 @@
+import time
+import threading
+
+
+class RateLimiter:
+    """Thread-safe token bucket allowing `rate` calls every `per` seconds.
+
+    `burst` tokens can be spent back to back (defaults to `rate`); after
+    that callers are spaced out evenly.
+    """
+
+    def __init__(self, rate, per=1.0, burst=None):
+        self.rate = rate
+        self.per = per
+        self.capacity = burst or rate
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate / self.per)
+        self._updated = now
+
+    def try_acquire(self):
+        """Take a token if one is available right now"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def delay(self):
+        """Seconds until the next token is available (0 if one is there now)"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (1 - self._tokens) * self.per / self.rate)
+
+    def acquire(self):
+        """Block until a token is available; returns the seconds spent waiting"""
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return now - started
+                wait = (1 - self._tokens) * self.per / self.rate
+            time.sleep(wait)
+
+
+class RequestScheduler:
+    """Per-endpoint-class token buckets behind one priority queue.
+
+    Every request names its endpoint class ("order", "quote", ...). A
+    waiting request is eligible once its class bucket has a token; among
+    eligible requests the lowest priority number goes first (FIFO within a
+    priority) and also spends a token from the shared `total_rate` bucket.
+    A data request that is blocked on its own class limit therefore never
+    holds up an order behind it, and orders win every contended slot.
+    """
+
+    def __init__(self, limits, total_rate=None, priorities=None):
+        self.buckets = {name: RateLimiter(rate) for name, rate in limits.items()}
+        self.total = RateLimiter(total_rate) if total_rate else None
+        self.priorities = priorities or {}
+        self._waiting = []
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._stats = {name: {"requests": 0, "queued": 0, "wait_total": 0.0, "wait_max": 0.0} for name in limits}
+
+    def _bucket(self, endpoint):
+        return self.buckets.get(endpoint) or self.buckets["default"]
+
+    def acquire(self, endpoint, priority=None):
+        """Block until `endpoint` may send a request; returns the seconds spent queued"""
+        if endpoint not in self.buckets:
+            endpoint = "default"
+        if priority is None:
+            priority = self.priorities.get(endpoint, 1)
+        started = time.monotonic()
+        with self._cond:
+            self._seq += 1
+            entry = (priority, self._seq, endpoint)
+            self._waiting.append(entry)
+            self._stats[endpoint]["queued"] += 1
+            while True:
+                ready = [e for e in self._waiting if self._bucket(e[2]).delay() == 0]
+                if ready and min(ready) == entry and (self.total is None or self.total.try_acquire()):
+                    self._bucket(endpoint).try_acquire()
+                    self._waiting.remove(entry)
+                    self._cond.notify_all()
+                    break
+                wait = self._bucket(endpoint).delay()
+                if self.total is not None:
+                    wait = max(wait, self.total.delay())
+                self._cond.wait(min(max(wait, 0.001), 0.05))
+            waited = time.monotonic() - started
+            stats = self._stats[endpoint]
+            stats["requests"] += 1
+            stats["queued"] -= 1
+            stats["wait_total"] += waited
+            stats["wait_max"] = max(stats["wait_max"], waited)
+        return waited
+
+    def stats(self):
+        """Queue depth and wait times per endpoint class, for monitoring"""
+        with self._cond:
+            return {name: {"requests": s["requests"], "queued": s["queued"],
+                           "wait_avg": s["wait_total"] / s["requests"] if s["requests"] else 0.0,
+                           "wait_max": s["wait_max"]}
+                    for name, s in self._stats.items()}
@@ -0,0 +1,145 @@
+import fcntl
+import mmap
+import os
+import pickle
+import struct
+import time
+
+STATE_DIR = os.getenv("KITE_CACHE_DIR", ".kite_cache")
+
+# seq, payload length, written_at
+HEADER = struct.Struct("<QQd")
+
+
+class LeaderLock:
+    """Elects one process per host through an exclusive flock on `path`.
+
+    The lock belongs to the open file, so it is released when the leader
+    exits or crashes and the next `try_acquire()` from another process
+    succeeds. `epoch` identifies one leadership term (pid and acquisition
+    time), so counters local to a leader can be told apart from the
+    previous leader's.
+    """
+
+    def __init__(self, path=os.path.join(STATE_DIR, "leader.lock")):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = None
+        self.epoch = None
+
+    @property
+    def is_leader(self):
+        return self._file is not None
+
+    def try_acquire(self):
+        if self._file is not None:
+            return True
+        f = open(self.path, "a+")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        self._file = f
+        self.epoch = (os.getpid(), time.time())
+        return True
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self.epoch = None
+
+
+class SharedSnapshot:
+    """Latest state object shared between processes through a memory-mapped file.
+
+    One writer (the leader) pickles the object into the mapping under a
+    seqlock: the sequence number is odd while a write is in progress, and a
+    reader retries when it saw an odd number or the number changed while it
+    copied. Readers map the same pages, so checking for a new snapshot is a
+    header read; the payload is copied and unpickled only when the
+    sequence number moved, and the decoded object is cached until then.
+    """
+
+    def __init__(self, path=os.path.join(STATE_DIR, "market_state.bin"), capacity=1 << 22):
+        self.path = path
+        self.capacity = capacity
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self._fd).st_size < HEADER.size + capacity:
+            os.ftruncate(self._fd, HEADER.size + capacity)
+        self._map()
+        self._cached_seq = None
+        self._cached = None
+
+    def _map(self):
+        size = os.fstat(self._fd).st_size
+        self._mm = mmap.mmap(self._fd, size)
+
+    def _header(self):
+        return HEADER.unpack_from(self._mm, 0)
+
+    @property
+    def seq(self):
+        return self._header()[0]
+
+    def age(self):
+        """Seconds since the last completed write, None if nothing was written yet"""
+        seq, _, written_at = self._header()
+        return time.time() - written_at if seq and not seq & 1 else None
+
+    def write(self, obj):
+        data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        seq, _, _ = self._header()
+        if seq & 1:
+            # The previous writer died mid-write
+            seq += 1
+        if HEADER.size + len(data) > len(self._mm):
+            os.ftruncate(self._fd, HEADER.size + max(len(data), 2 * (len(self._mm) - HEADER.size)))
+            self._mm.close()
+            self._map()
+        HEADER.pack_into(self._mm, 0, seq + 1, 0, 0.0)
+        self._mm[HEADER.size:HEADER.size + len(data)] = data
+        HEADER.pack_into(self._mm, 0, seq + 2, len(data), time.time())
+        return seq + 2
+
+    def read(self, retries=1000):
+        """(seq, object) of the latest complete snapshot; (0, None) before the first write"""
+        for _ in range(retries):
+            seq, length, _ = self._header()
+            if seq & 1:
+                time.sleep(0)
+                continue
+            if seq == self._cached_seq:
+                return seq, self._cached
+            if seq == 0:
+                return 0, None
+            if HEADER.size + length > len(self._mm):
+                # The writer grew the file
+                self._mm.close()
+                self._map()
+                continue
+            data = self._mm[HEADER.size:HEADER.size + length]
+            if self._header()[0] != seq:
+                continue
+            self._cached_seq, self._cached = seq, pickle.loads(data)
+            return seq, self._cached
+        raise TimeoutError(f"No consistent snapshot in {self.path} after {retries} attempts")
+
+    def wait_for_update(self, seq, timeout=1.0, poll=0.05):
+        """Block until the sequence number moves past `seq` (or timeout); returns read()"""
+        deadline = time.time() + timeout
+        while self.seq <= seq and time.time() < deadline:
+            time.sleep(poll)
+        return self.read()
+
+    def close(self):
+        self._mm.close()
+        os.close(self._fd)
@@ -0,0 +1,300 @@
+import fcntl
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from transport import shared_session
+
+DEFAULT_PATH = os.path.join(os.getenv("KITE_CACHE_DIR", ".kite_cache"), "upload_spool.jsonl")
+
+
+def retryable(status_code):
+    """True for responses worth retrying later; any other 4xx means the backend rejected the payload"""
+    return status_code >= 500 or status_code in (408, 429)
+
+
+class Spool:
+    """Append-only on-disk log of backend uploads that could not be delivered.
+
+    Each failed POST is appended as one JSON line with a unique id;
+    delivering it later appends an {"ack": id} line instead of rewriting the
+    file, so recording and acknowledging are both single appends. `compact()`
+    rewrites the file with only the unacknowledged records, which replay
+    does once acks pile up. An flock on the file keeps gunicorn workers from
+    interleaving writes. Records the backend rejects outright are moved to
+    a ".rejected" file next to the spool so they cannot block the rest.
+    Records older than `max_age` seconds, and the oldest beyond
+    `max_records`, are moved to an ".expired" file the same way, so a long
+    outage cannot grow the spool without bound.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, fsync=True, compact_after=1000, max_records=100000,
+                 max_age=7 * 24 * 3600):
+        self.path = path
+        self.fsync = fsync
+        self.compact_after = compact_after
+        self.max_records = max_records
+        self.max_age = max_age
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._ids = itertools.count()
+        self._acks = 0
+        self._thread = None
+
+    def _locked(self, mode):
+        while True:
+            f = open(self.path, mode)
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(self.path).st_ino:
+                    return f
+            except FileNotFoundError:
+                pass
+            # Compacted away while we waited for the lock, open the new file
+            f.close()
+
+    def _scan(self, f):
+        """(pending records in file order, ack line count) from an open spool file"""
+        records, acks = {}, 0
+        f.seek(0)
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A torn final line from a crash mid-append
+                continue
+            if "ack" in entry:
+                records.pop(entry["ack"], None)
+                acks += 1
+            else:
+                records[entry["id"]] = entry
+        return list(records.values()), acks
+
+    def _write(self, f, lines):
+        f.write("".join(json.dumps(line, default=str) + "\n" for line in lines))
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def append(self, url, payload, body="form", headers=None):
+        """Record one undelivered POST; returns its id"""
+        return self.extend(url, [payload], body, headers)[0]
+
+    def extend(self, url, payloads, body="form", headers=None):
+        """Record several undelivered POSTs to one url in a single append"""
+        ids = [f"{os.getpid()}-{time.time_ns()}-{next(self._ids)}" for _ in payloads]
+        with self._lock, self._locked("a") as f:
+            self._write(f, [{"id": i, "ts": time.time(), "url": url, "body": body, "headers": headers,
+                             "payload": payload} for i, payload in zip(ids, payloads)])
+            return ids
+
+    def pending(self):
+        if not os.path.exists(self.path):
+            return []
+        with self._lock, self._locked("r") as f:
+            return self._scan(f)[0]
+
+    def __len__(self):
+        return len(self.pending())
+
+    def ack(self, ids):
+        if not ids:
+            return
+        with self._lock, self._locked("a") as f:
+            self._write(f, [{"ack": i} for i in ids])
+            self._acks += len(ids)
+
+    def _move_aside(self, suffix, records):
+        with self._lock, open(self.path + suffix, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            self._write(f, records)
+        self.ack([record["id"] for record in records])
+
+    def reject(self, records, status_code):
+        """Move records the backend refused out of the way, keeping them for inspection"""
+        self._move_aside(".rejected", [dict(record, status=status_code) for record in records])
+
+    def expire(self, pending=None, now=None):
+        """Move records past `max_age` or beyond `max_records` to the ".expired" file.
+
+        Returns the records still pending, oldest first.
+        """
+        pending = self.pending() if pending is None else pending
+        now = time.time() if now is None else now
+        keep = [r for r in pending if self.max_age is None or now - r["ts"] <= self.max_age]
+        if self.max_records is not None and len(keep) > self.max_records:
+            keep = keep[len(keep) - self.max_records:]
+        if len(keep) < len(pending):
+            kept = {r["id"] for r in keep}
+            expired = [r for r in pending if r["id"] not in kept]
+            print(f"Moving {len(expired)} spooled upload(s) to {self.path}.expired")
+            self._move_aside(".expired", expired)
+        return keep
+
+    def compact(self):
+        """Rewrite the spool with only unacknowledged records"""
+        if not os.path.exists(self.path):
+            return
+        with self._lock, self._locked("a+") as f:
+            self._compact(f, self._scan(f)[0])
+            self._acks = 0
+
+    def _compact(self, f, pending):
+        # The replacement is written next to the spool and renamed over it while the old file is still
+        # locked; writers that opened the old inode re-check after acquiring the lock
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as out:
+            self._write(out, pending)
+        os.replace(tmp, self.path)
+
+    def replay(self, session=None, batch_size=500, max_workers=8):
+        """Send everything pending, oldest first, and ack what was delivered.
+
+        Records to the same url are sent in groups of up to `batch_size`,
+        one request per record exactly as the original call made it, with
+        `max_workers` requests in flight. Records answered with a
+        non-retryable 4xx are moved aside with reject(); any other failure
+        stops the replay after its group, the backend is presumably still
+        down. Expired records are moved aside with expire() first. Returns
+        (delivered, remaining), or (0, None) when another process is already
+        replaying.
+        """
+        with self._replay_lock, open(self.path + ".replay", "a") as guard:
+            try:
+                fcntl.flock(guard, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0, None
+            session = session or shared_session()
+            pending = self.expire()
+            delivered = rejected = 0
+            for url, body, headers, group in _groups(pending, batch_size):
+                results = post_many(session, url, [r["payload"] for r in group], body, headers, max_workers)
+                sent, refused, failed = [], {}, None
+                for record, result in zip(group, results):
+                    if result == 200:
+                        sent.append(record["id"])
+                    elif isinstance(result, int) and not retryable(result):
+                        refused.setdefault(result, []).append(record)
+                    elif failed is None:
+                        failed = result
+                self.ack(sent)
+                delivered += len(sent)
+                for status_code, records in refused.items():
+                    print(f"Spool replay to {url} rejected with status {status_code}, "
+                          f"moving {len(records)} record(s) to {self.path}.rejected")
+                    self.reject(records, status_code)
+                    rejected += len(records)
+                if failed is not None:
+                    print(f"Spool replay to {url} failed: {failed}")
+                    break
+            remaining = len(pending) - delivered - rejected
+            if self._acks >= self.compact_after:
+                self.compact()
+            if delivered:
+                print(f"Replayed {delivered} spooled uploads, {remaining} remaining")
+            return delivered, remaining
+
+    def start_replayer(self, interval=30):
+        """Background thread that retries the spool every `interval` seconds while it is non-empty"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._replay_loop, args=(interval,), name="spool-replay",
+                                            daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def _replay_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path):
+                    self.replay()
+            except Exception as e:
+                print(f"Error replaying upload spool: {e}")
+
+
+def _groups(records, batch_size):
+    """Consecutive records to the same url and body format, at most batch_size per group"""
+    group = []
+    for record in records:
+        key = (record["url"], record["body"], record["headers"])
+        if group and (key != group_key or len(group) >= batch_size):
+            yield group_key + (group,)
+            group = []
+        group_key = key
+        group.append(record)
+    if group:
+        yield group_key + (group,)
+
+
+def post_kwargs(payload, body="form", headers=None):
+    """POST kwargs sending one payload the way the synchronous api.py call does"""
+    if body == "json":
+        headers = dict(headers or {}, **{"Content-Type": "application/json"})
+        if not isinstance(payload, (str, bytes)):
+            payload = json.dumps(payload, default=str)
+    return {"data": payload, "headers": headers}
+
+
+def post_many(session, url, payloads, body="form", headers=None, max_workers=8):
+    """POST every payload to `url`, up to `max_workers` at a time over the session's keep-alive pool.
+
+    Returns one result per payload, in order: the status code, or the
+    exception the request raised.
+    """
+    def post(payload):
+        try:
+            return session.post(url, **post_kwargs(payload, body, headers)).status_code
+        except Exception as e:
+            return e
+
+    if len(payloads) <= 1:
+        return [post(payload) for payload in payloads]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(payloads))) as pool:
+        return list(pool.map(post, payloads))
+
+
+_spools = {}
+_spools_lock = threading.Lock()
+
+
+def shared_spool():
+    """Process-wide Spool on DEFAULT_PATH with its replayer running"""
+    pid = os.getpid()
+    spool = _spools.get(pid)
+    if spool is None:
+        with _spools_lock:
+            spool = _spools.get(pid)
+            if spool is None:
+                _spools.clear()
+                spool = _spools[pid] = Spool()
+                spool.start_replayer()
+    return spool
+
+
+def resume_spool():
+    """Start replaying records an earlier process left in DEFAULT_PATH, if there are any.
+
+    Called from a long-running process's startup rather than on import, so
+    short-lived tools that import api.py do not start a replayer.
+    """
+    try:
+        if os.path.getsize(DEFAULT_PATH):
+            return shared_spool()
+    except OSError:
+        pass
+    return None
+
+
+if __name__ == "__main__":
+    spool = Spool()
+    delivered, remaining = spool.replay()
+    if remaining is None:
+        print("Another process is already replaying the spool")
+    else:
+        spool.compact()
+        print(f"Delivered {delivered}, {remaining} still spooled in {spool.path}")
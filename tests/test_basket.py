@@ -0,0 +1,46 @@
+from urllib.parse import parse_qs
+
+import pytest
+
+from basket import BasketDispatcher, OrderIntent
+
+ACCOUNTS = {f"AC{i:02d}": f"token{i}" for i in range(12)}
+
+
+@pytest.fixture
+def dispatcher():
+    dispatcher = BasketDispatcher(ACCOUNTS, dry_run=True)
+    yield dispatcher
+    dispatcher.close()
+
+
+def test_fan_out_places_one_order_per_account(dispatcher):
+    results = dispatcher.dispatch(OrderIntent("NIFTY24JUNFUT", "BUY", 50), quantities={"AC03": 75})
+
+    assert list(results) == list(ACCOUNTS)
+    assert all(result.ok for result in results.values())
+    orders = dispatcher.server.orders
+    assert len(orders) == len(ACCOUNTS)
+    assert len({result.order_id for result in results.values()}) == len(ACCOUNTS)
+    quantities = sorted(parse_qs(order["params"])["quantity"][0] for order in orders)
+    assert quantities == ["50"] * 11 + ["75"]
+
+
+def test_unknown_account_does_not_block_the_others(dispatcher):
+    results = dispatcher.dispatch(OrderIntent("NIFTY24JUNFUT", "SELL", 50), accounts=["AC01", "ZZ99"], timeout=2)
+
+    assert results["AC01"].ok
+    assert results["ZZ99"].error == "Unknown account"
+    assert len(dispatcher.server.orders) == 1
+
+
+def test_empty_selection_sends_nothing(dispatcher):
+    assert dispatcher.dispatch(OrderIntent("NIFTY24JUNFUT", "BUY", 50), accounts=[]) == {}
+    assert dispatcher.server.orders == []
+
+
+def test_rejection_carries_the_broker_message(dispatcher):
+    dispatcher.server.reject = "Insufficient funds"
+    results = dispatcher.dispatch(OrderIntent("NIFTY24JUNFUT", "BUY", 50), accounts=["AC00", "AC01"])
+
+    assert [result.error for result in results.values()] == ["Insufficient funds"] * 2
@@ -0,0 +1,32 @@
+import random
+from datetime import datetime, timedelta
+
+from candles import CandleRing
+
+
+def test_hv_hr_match_a_brute_force_window():
+    rng = random.Random(7)
+    ring = CandleRing(25)
+    history = []
+    start = datetime(2026, 10, 16, 9, 15)
+    for i in range(500):
+        low = rng.uniform(50, 100)
+        high = low + rng.choice([0, 0, rng.uniform(0, 10)])
+        volume = rng.choice([0, rng.randrange(1, 10 ** 6)])
+        ring.append(start + timedelta(minutes=i), low, high, low, high, volume)
+        history.append((high - low, volume))
+        window = history[-25:]
+        assert len(ring) == len(window)
+        assert ring.hv == max(v for _, v in window)
+        assert ring.hr == max(r for r, _ in window)
+
+
+def test_window_keeps_the_newest_candles_in_order():
+    ring = CandleRing(3)
+    assert (len(ring), ring.hv, ring.hr) == (0, 0, 0)
+    for i in range(5):
+        ring.append(i, 1, 1 + i, 1, 1, 100 - i)
+    assert [candle["date"] for candle in ring] == [2, 3, 4]
+    assert ring[-1]["range"] == 4
+    # The old maximum volume (100) has left the window
+    assert ring.hv == 98
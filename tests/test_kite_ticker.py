@@ -0,0 +1,69 @@
+import struct
+import threading
+
+from kite_ticker import KiteTicker, ReplayServer, build_message, parse_binary
+
+NSE_TOKEN = 738561          # segment 1, prices in paise
+INDEX_TOKEN = 256265        # segment 9 (indices)
+
+
+def ltp_packet(token, ltp):
+    return struct.pack(">ii", token, ltp)
+
+
+def quote_packet(token, ltp, volume=1000, ohlc=(100, 120, 90, 110)):
+    o, h, l, c = ohlc
+    return struct.pack(">11i", token, ltp, 5, ltp, volume, 10, 20, o, h, l, c)
+
+
+def full_packet(token, ltp):
+    depth = b"".join(struct.pack(">iih2x", 10 + i, ltp + i, 1) for i in range(10))
+    return quote_packet(token, ltp) + struct.pack(">5i", 1700000000, 50, 60, 40, 1700000001) + depth
+
+
+def index_packet(token, ltp):
+    return struct.pack(">6i", token, ltp, 2000000, 1900000, 1950000, 1980000)
+
+
+def test_parse_binary_modes():
+    message = build_message([ltp_packet(NSE_TOKEN, 12345), quote_packet(NSE_TOKEN, 250050),
+                             full_packet(NSE_TOKEN, 10000), index_packet(INDEX_TOKEN, 1990000)])
+    ltp, quote, full, index = parse_binary(message)
+
+    assert (ltp.mode, ltp.last_price) == (KiteTicker.MODE_LTP, 123.45)
+    assert quote.mode == KiteTicker.MODE_QUOTE
+    assert (quote.last_price, quote.volume, quote.high, quote.close) == (2500.5, 1000, 1.2, 1.1)
+    assert full.mode == KiteTicker.MODE_FULL
+    assert (full.oi, full.exchange_timestamp) == (50, 1700000001)
+    bids, asks = full.depth
+    assert bids[0] == (10, 100.0, 1) and asks[-1] == (19, 100.09, 1)
+    assert not index.tradable and index.last_price == 19900.0
+
+
+def test_heartbeat_is_empty():
+    assert parse_binary(b"\x00") == []
+
+
+def test_replay_server_delivers_ticks():
+    messages = [build_message([quote_packet(NSE_TOKEN, 10000 + i, volume=i)]) for i in range(20)]
+    server = ReplayServer(messages).start()
+    received = []
+    done = threading.Event()
+
+    def on_ticks(ticks):
+        received.extend(ticks)
+        if len(received) >= len(messages):
+            done.set()
+
+    ticker = KiteTicker("token", "AB1234", url=server.url, on_ticks=on_ticks)
+    try:
+        ticker.connect()
+        ticker.subscribe([NSE_TOKEN])
+        assert done.wait(10)
+    finally:
+        ticker.close()
+        server.stop()
+
+    assert [tick.volume for tick in received] == list(range(20))
+    assert received[-1].last_price == 100.19
+    assert {"a": "subscribe", "v": [NSE_TOKEN]} in server.received
@@ -0,0 +1,112 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+import requests
+
+from spool import Spool
+
+
+class Backend(ThreadingHTTPServer):
+    """Local stand-in for the upload backend: records bodies, answers with `status(path, body)`"""
+
+    def __init__(self, status=lambda path, body: 200):
+        self.status = status
+        self.received = []
+        self.lock = threading.Lock()
+        super().__init__(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"])).decode()
+        with self.server.lock:
+            self.server.received.append((self.path, self.headers.get("Content-Type"), body))
+        self.send_response(self.server.status(self.path, body))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return Spool(str(tmp_path / "spool.jsonl"), fsync=False)
+
+
+def serve(request, status=lambda path, body: 200):
+    backend = Backend(status)
+    request.addfinalizer(backend.shutdown)
+    return backend
+
+
+def test_replay_sends_records_as_originally_posted(request, spool):
+    backend = serve(request)
+    spool.extend(backend.url("/quote"), [{"symbol": f"S{i}"} for i in range(20)])
+    spool.append(backend.url("/positions"), {"qty": 1}, body="json")
+
+    with requests.Session() as session:
+        assert spool.replay(session) == (21, 0)
+
+    forms = sorted(parse_qs(body)["symbol"][0] for path, _, body in backend.received if path == "/quote")
+    assert forms == sorted(f"S{i}" for i in range(20))
+    assert ("/positions", "application/json", json.dumps({"qty": 1})) in backend.received
+    assert spool.pending() == []
+
+
+def test_replay_stops_at_a_retryable_failure(request, spool):
+    backend = serve(request, lambda path, body: 503 if path == "/down" else 200)
+    spool.append(backend.url("/down"), {"a": 1})
+    spool.append(backend.url("/up"), {"b": 2})
+
+    with requests.Session() as session:
+        assert spool.replay(session) == (0, 2)
+
+    assert [path for path, _, _ in backend.received] == ["/down"]
+    assert len(spool.pending()) == 2
+
+
+def test_rejected_records_are_moved_aside(request, spool):
+    backend = serve(request, lambda path, body: 422 if "bad" in body else 200)
+    spool.extend(backend.url("/quote"), [{"v": "good"}, {"v": "bad"}, {"v": "good2"}])
+
+    with requests.Session() as session:
+        assert spool.replay(session) == (2, 0)
+
+    with open(spool.path + ".rejected") as f:
+        rejected = [json.loads(line) for line in f]
+    assert [(r["payload"], r["status"]) for r in rejected] == [({"v": "bad"}, 422)]
+    assert spool.pending() == []
+
+
+def test_compact_keeps_only_pending_records(spool):
+    ids = spool.extend("http://backend/quote", list(range(10)))
+    spool.ack(ids[:7])
+
+    spool.compact()
+
+    with open(spool.path) as f:
+        lines = [json.loads(line) for line in f]
+    assert [line["payload"] for line in lines] == [7, 8, 9]
+    assert [r["payload"] for r in spool.pending()] == [7, 8, 9]
+
+
+def test_expire_caps_count_and_age(spool):
+    spool.max_records = 3
+    spool.max_age = 60
+    spool.extend("http://backend/quote", list(range(5)))
+
+    assert [r["payload"] for r in spool.expire()] == [2, 3, 4]
+    assert spool.expire(now=time.time() + 120) == []
+
+    with open(spool.path + ".expired") as f:
+        assert [json.loads(line)["payload"] for line in f] == [0, 1, 2, 3, 4]
+    assert spool.pending() == []
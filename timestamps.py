@@ -0,0 +1,39 @@
+from datetime import datetime, date, timedelta, timezone
+
+import dateutil.parser
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+# tzinfo objects by offset suffix ("+0530"), so each one is built only once
+_TIMEZONES = {"+0530": IST}
+
+
+def _timezone(offset):
+    tz = _TIMEZONES.get(offset)
+    if tz is None:
+        minutes = int(offset[1:3]) * 60 + int(offset[3:5])
+        tz = _TIMEZONES[offset] = timezone(timedelta(minutes=-minutes if offset[0] == "-" else minutes))
+    return tz
+
+
+def parse_timestamp(value):
+    """Parse a broker timestamp such as "2024-07-04T09:15:00+0530".
+
+    That fixed layout is split by position and handed to the C
+    fromisoformat() with a cached tzinfo; anything else falls back to
+    dateutil.
+    """
+    if len(value) == 24 and value[10] == "T" and value[19] in "+-":
+        try:
+            return datetime.fromisoformat(value[:19]).replace(tzinfo=_timezone(value[19:]))
+        except ValueError:
+            pass
+    return dateutil.parser.parse(value)
+
+
+def parse_date(value):
+    """Parse a "YYYY-MM-DD" date (instrument expiry), falling back to dateutil"""
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return dateutil.parser.parse(value).date()
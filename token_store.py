@@ -0,0 +1,149 @@
+import fcntl
+import json
+import os
+import threading
+import time
+
+DEFAULT_PATH = os.getenv("KITE_CONFIG_PATH", "config.json")
+
+
+class TokenStore:
+    """config.json as a cached key/value store with atomic, concurrent-safe updates.
+
+    Reads come from an in-memory dict that is reloaded only when the file's
+    mtime/size/inode change (checked at most every `check_interval`
+    seconds), so `get()` is a dict lookup. Updates take an exclusive lock on
+    a sidecar ".lock" file, re-read the current file, change only the given
+    keys and write a temp file that is renamed over config.json, so
+    concurrent writers never lose each other's keys and readers never see
+    a half-written file.
+
+    Callbacks registered with `watch()` are called with {key: new value}
+    whenever keys change, whether by this process or another one.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._data = {}
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.RLock()
+        self._watchers = []
+        self._thread = None
+        self._reload()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _reload(self):
+        """Reload from disk if the file changed; returns {key: value} of what changed"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            signature = self._stat()
+            if signature == self._signature:
+                return {}
+            data = self._read()
+            self._signature = signature
+            changes = {k: v for k, v in data.items() if self._data.get(k) != v}
+            changes.update({k: None for k in self._data if k not in data})
+            self._data = data
+        if changes:
+            self._notify(changes)
+        return changes
+
+    def _maybe_reload(self):
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self._reload()
+
+    def get(self, key, default=None):
+        self._maybe_reload()
+        return self._data.get(key, default)
+
+    def __getitem__(self, key):
+        self._maybe_reload()
+        return self._data[key]
+
+    def __contains__(self, key):
+        self._maybe_reload()
+        return key in self._data
+
+    def snapshot(self):
+        """Copy of the whole config"""
+        self._maybe_reload()
+        return dict(self._data)
+
+    def set(self, key, value):
+        self.update({key: value})
+
+    def update(self, values):
+        """Atomically set several keys, leaving every other key as it is on disk"""
+        lock_path = self.path + ".lock"
+        with self._lock, open(lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            data = self._read()
+            data.update(values)
+            directory = os.path.dirname(os.path.abspath(self.path))
+            tmp = os.path.join(directory, f".{os.path.basename(self.path)}.{os.getpid()}.tmp")
+            with open(tmp, "w") as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        # Pick up our own write (and anything another writer did before it) and notify watchers
+        return self._reload()
+
+    def watch(self, callback):
+        """Call `callback(changes)` on every change; starts the background file watcher"""
+        with self._lock:
+            self._watchers.append(callback)
+        self.start_watcher()
+        return callback
+
+    def start_watcher(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._watch_loop, name="token-store-watch", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def _watch_loop(self):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                self._reload()
+            except Exception as e:
+                print(f"Error reloading {self.path}: {e}")
+
+    def _notify(self, changes):
+        for callback in list(self._watchers):
+            try:
+                callback(changes)
+            except Exception as e:
+                print(f"Error in config watcher: {e}")
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def config_store(path=DEFAULT_PATH):
+    """Process-wide TokenStore for `path` (one per pid so a forked worker starts its own watcher)"""
+    key = (os.getpid(), os.path.abspath(path))
+    store = _stores.get(key)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(key)
+            if store is None:
+                store = _stores[key] = TokenStore(path)
+    return store
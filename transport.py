@@ -0,0 +1,68 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (connect, read) timeouts in seconds applied to every request that does not set its own
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# Connections kept alive per host; anything else gets DEFAULT_POOL_SIZE
+POOL_SIZES = {
+    "https://kite.zerodha.com": 20,
+    "https://api.kite.trade": 10,
+    "https://trading.omsaiservices.in": 10,
+}
+DEFAULT_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 10))
+
+
+def _retry(retries, backoff):
+    # POST is left out on purpose: retrying an order placement could duplicate it
+    return Retry(total=retries, backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504),
+                 allowed_methods=frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}),
+                 respect_retry_after_header=True, raise_on_status=False)
+
+
+class PooledSession(requests.Session):
+    """requests.Session with per-host keep-alive pools, default timeouts and
+    retry with exponential backoff for idempotent requests."""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=3, backoff=0.3):
+        super().__init__()
+        self.timeout = timeout
+        self.mount("https://", HTTPAdapter(pool_maxsize=DEFAULT_POOL_SIZE, max_retries=_retry(retries, backoff)))
+        self.mount("http://", HTTPAdapter(pool_maxsize=DEFAULT_POOL_SIZE, max_retries=_retry(retries, backoff)))
+        for prefix, size in POOL_SIZES.items():
+            self.mount(prefix, HTTPAdapter(pool_connections=1, pool_maxsize=size,
+                                           max_retries=_retry(retries, backoff)))
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def new_session():
+    """A fresh pooled session, e.g. one per broker account so cookies stay separate"""
+    return PooledSession()
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_session():
+    """Process-wide pooled session for calls that carry their own headers.
+
+    Keyed by pid so a gunicorn worker never reuses sockets opened by the
+    master before the fork.
+    """
+    pid = os.getpid()
+    session = _shared.get(pid)
+    if session is None:
+        with _shared_lock:
+            session = _shared.get(pid)
+            if session is None:
+                _shared.clear()
+                session = _shared[pid] = PooledSession()
+    return session
@@ -0,0 +1,222 @@
+import atexit
+import os
+import queue
+import threading
+import time
+
+from transport import shared_session
+from spool import post_many, retryable
+
+
+class BatchUploader:
+    """Background uploader that coalesces records into per-endpoint batches.
+
+    `endpoints` maps a name to (url, body format). Producers call `submit()`,
+    which only touches an in-memory queue; one worker thread groups records
+    per endpoint and sends a batch once it holds `max_batch` records or its
+    oldest record is `max_delay` seconds old.
+
+    The backend has no batch endpoint, so every record still goes out as
+    its own POST with the same body the synchronous api.py call sends; a
+    batch is sent with up to `max_workers` of those requests in flight over
+    the shared keep-alive pool instead of one round trip after another.
+
+    When the queue is full `submit()` blocks (up to `timeout`) so a
+    producer cannot outrun the network indefinitely; with block=False it
+    returns False and the record is counted as dropped.
+
+    Records that fail with a network error or a retryable status are
+    written to `spool` (a spool.Spool) when one is given, so they are
+    replayed once the backend is reachable again. At interpreter exit the
+    queue is flushed for up to `exit_timeout` seconds and whatever is left
+    is spooled rather than lost with the daemon thread.
+    """
+
+    def __init__(self, endpoints, max_queue=10000, max_batch=500, max_delay=1.0, session=None, spool=None,
+                 max_workers=8, exit_timeout=5):
+        self.endpoints = endpoints
+        self.spool = spool
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.session = session
+        self.max_workers = max_workers
+        self.exit_timeout = exit_timeout
+        self.sent = 0
+        self.batches = 0
+        self.errors = 0
+        self.dropped = 0
+        self._queue = queue.Queue(max_queue)
+        self._pending = {}
+        self._idle = threading.Condition()
+        self._busy = 0
+        self._thread = None
+        self._stopping = False
+        self._exit_registered = False
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="batch-uploader", daemon=True)
+            self._thread.start()
+        if not self._exit_registered:
+            self._exit_registered = True
+            atexit.register(self.close, self.exit_timeout)
+        return self
+
+    def submit(self, endpoint, payload, block=True, timeout=None):
+        """Queue one record for `endpoint`; False if the queue stayed full"""
+        if endpoint not in self.endpoints:
+            raise KeyError(f"Unknown upload endpoint {endpoint}")
+        with self._idle:
+            self._busy += 1
+        try:
+            self._queue.put((endpoint, payload), block, timeout)
+            return True
+        except queue.Full:
+            with self._idle:
+                self._busy -= 1
+                self.dropped += 1
+            return False
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def flush(self, timeout=None):
+        """Wait until everything submitted so far has been sent or has failed"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._idle:
+            while self._busy:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def close(self, timeout=10):
+        """Send what is queued (waiting up to `timeout`), then stop and spool anything still unsent"""
+        self.flush(timeout)
+        self._stopping = True
+        try:
+            # Wake the worker if it is waiting for records
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(1)
+            if self._thread.is_alive():
+                # Stuck in a send; the worker spools its leftovers itself if it gets out in time
+                return
+        self._spool_unsent()
+
+    def stats(self):
+        return {"queued": self.qsize(), "sent": self.sent, "batches": self.batches,
+                "errors": self.errors, "dropped": self.dropped}
+
+    def _run(self):
+        while not self._stopping:
+            wait = self._next_deadline()
+            try:
+                item = self._queue.get(timeout=wait)
+            except queue.Empty:
+                item = None
+            if item is not None:
+                endpoint, payload = item
+                self._pending.setdefault(endpoint, (time.time(), []))[1].append(payload)
+                # Drain whatever else is already waiting before deciding what to send
+                for _ in range(self.max_batch - 1):
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        continue
+                    endpoint, payload = item
+                    self._pending.setdefault(endpoint, (time.time(), []))[1].append(payload)
+            self._send_due()
+        self._spool_unsent()
+
+    def _spool_unsent(self):
+        unsent = {}
+        for endpoint, (_, records) in self._pending.items():
+            unsent.setdefault(endpoint, []).extend(records)
+        self._pending = {}
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                continue
+            endpoint, payload = item
+            unsent.setdefault(endpoint, []).append(payload)
+        for endpoint, records in unsent.items():
+            url, body = self.endpoints[endpoint]
+            if self.spool is None:
+                print(f"Dropping {len(records)} unsent {endpoint} records")
+            else:
+                try:
+                    self.spool.extend(url, records, body)
+                except OSError as e:
+                    print(f"Could not spool {len(records)} unsent {endpoint} records: {e}")
+            with self._idle:
+                self._busy -= len(records)
+                self._idle.notify_all()
+
+    def _next_deadline(self):
+        if not self._pending:
+            return self.max_delay
+        oldest = min(started for started, _ in self._pending.values())
+        return max(0.0, oldest + self.max_delay - time.time())
+
+    def _send_due(self):
+        now = time.time()
+        for endpoint, (started, records) in list(self._pending.items()):
+            if len(records) >= self.max_batch or now - started >= self.max_delay:
+                del self._pending[endpoint]
+                for start in range(0, len(records), self.max_batch):
+                    self._send(endpoint, records[start:start + self.max_batch])
+
+    def _send(self, endpoint, records):
+        url, body = self.endpoints[endpoint]
+        session = self.session or shared_session()
+        results = post_many(session, url, records, body, max_workers=self.max_workers)
+        sent, retry, failed = 0, [], 0
+        for record, result in zip(records, results):
+            if result == 200:
+                sent += 1
+                continue
+            failed += 1
+            # Exceptions and 5xx may succeed later; other 4xx were rejected by the backend
+            if not isinstance(result, int) or retryable(result):
+                retry.append(record)
+        if failed:
+            print(f"Failed to upload {failed} of {len(records)} {endpoint} records, last error:",
+                  next(result for result in reversed(results) if result != 200))
+        if retry and self.spool is not None:
+            try:
+                self.spool.extend(url, retry, body)
+            except OSError as e:
+                print(f"Could not spool {endpoint} batch: {e}")
+        with self._idle:
+            self.batches += 1
+            self.sent += sent
+            self.errors += failed
+            self._busy -= len(records)
+            self._idle.notify_all()
+
+
+_uploaders = {}
+_uploaders_lock = threading.Lock()
+
+
+def shared_uploader(endpoints, **kwargs):
+    """Process-wide started uploader for `endpoints` (one per pid, like transport.shared_session)"""
+    pid = os.getpid()
+    uploader = _uploaders.get(pid)
+    if uploader is None:
+        with _uploaders_lock:
+            uploader = _uploaders.get(pid)
+            if uploader is None:
+                _uploaders.clear()
+                uploader = _uploaders[pid] = BatchUploader(endpoints, **kwargs).start()
+    return uploader
@@ -0,0 +1,117 @@
+import itertools
+import threading
+
+from candles import CandleBuilder, CandleRing
+
+# Window versions are unique across SymbolState objects, so a re-added symbol never reuses one.
+# They are only unique within this process; followers pair them with the leader's epoch.
+_versions = itertools.count(1)
+
+
+class SymbolState:
+    """Live state of one watched instrument"""
+    __slots__ = ("symbol", "instrument_token", "candles", "builder", "ltp", "cv", "volume_condition", "updated_at",
+                 "candles_version")
+
+    def __init__(self, symbol, instrument_token, window):
+        self.symbol = symbol
+        self.instrument_token = instrument_token
+        self.candles = CandleRing(window)
+        self.builder = CandleBuilder()
+        self.ltp = 0
+        self.cv = 0
+        self.volume_condition = False
+        self.updated_at = None
+        # Changes whenever the candle window changes
+        self.candles_version = next(_versions)
+
+    def seed(self, records):
+        """Load the window from historical candles"""
+        window = CandleRing(self.candles.capacity)
+        for candle in records:
+            window.append_candle(candle)
+        self.candles = window
+        self.candles_version = next(_versions)
+        if records:
+            self.ltp = records[-1]['close']
+
+    def resize(self, window):
+        """Change the window length, keeping the newest candles that still fit"""
+        ring = CandleRing(window)
+        for candle in list(self.candles)[-window:]:
+            ring.append_candle(candle)
+        self.candles = ring
+        self.candles_version = next(_versions)
+
+    def update(self, now, quote):
+        """Apply one quote; returns the candle that closed, if any"""
+        self.ltp = quote['last_price']
+        closed = self.builder.update(now, self.ltp, quote['volume'])
+        # A bar we only saw part of would understate volume, keep it out of the window
+        if closed is not None and not self.builder.last_closed_partial:
+            self.candles.append_candle(closed)
+            self.candles_version = next(_versions)
+        self.cv = self.builder.current['volume']
+        self.volume_condition = len(self.candles) > 0 and self.cv >= self.candles.hv
+        self.updated_at = now
+        return closed
+
+
+class Watchlist:
+    """Per-symbol state for many instruments, updated from one batched quote.
+
+    The poller fetches every watched symbol in a single call per cycle and
+    `apply()` fans that snapshot out to the individual SymbolState objects.
+    """
+    # The quote endpoint accepts 500 instruments per request and the main symbol
+    # takes one of them, so a full watchlist still fits a single poll
+    MAX_SYMBOLS = 499
+
+    def __init__(self, window=25):
+        self.window = window
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._states)
+
+    def __contains__(self, symbol):
+        return symbol in self._states
+
+    def get(self, symbol):
+        return self._states.get(symbol)
+
+    def symbols(self):
+        return list(self._states)
+
+    def add(self, symbol, instrument_token):
+        with self._lock:
+            state = self._states.get(symbol)
+            if state is None:
+                if len(self._states) >= self.MAX_SYMBOLS:
+                    raise ValueError(f"Watchlist is limited to {self.MAX_SYMBOLS} symbols")
+                state = self._states[symbol] = SymbolState(symbol, instrument_token, self.window)
+            return state
+
+    def resize(self, window):
+        """Apply a new window length to every symbol (and to symbols added later)"""
+        with self._lock:
+            self.window = window
+            states = list(self._states.values())
+        for state in states:
+            state.resize(window)
+
+    def remove(self, symbol):
+        with self._lock:
+            return self._states.pop(symbol, None) is not None
+
+    def apply(self, now, quotes):
+        """Update every watched symbol present in a quote snapshot"""
+        for symbol, state in list(self._states.items()):
+            quote = quotes.get(symbol)
+            if quote is not None:
+                state.update(now, quote)
+
+    def breakouts(self):
+        """Symbols whose current-minute volume has reached the window's highest volume"""
+        return [symbol for symbol, state in self._states.items() if state.volume_condition]
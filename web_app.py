@@ -1,14 +1,40 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, g, render_template, jsonify, request
 from kite_trade import *
 from datetime import datetime, timedelta
 import json
 import time
 import threading
 import os
+import queue
 from quote import get_quote
+import instrument_cache
+from candle_store import CandleStore
+from market_poller import QuotePoller
+from event_stream import EventBroadcaster
+from candles import CandleBuilder, CandleRing
+from watchlist import Watchlist
+from metrics import ApiMetrics, Histogram, PrometheusWriter, LATENCY_BUCKETS
+from token_store import config_store
+from shared_state import STATE_DIR, LeaderLock, SharedSnapshot
+from spool import resume_spool
+
+# When this process started up; reset in each forked gunicorn worker by start_background()
+startup_started = time.time()
+IMPORT_PID = os.getpid()
 
 app = Flask(__name__)
 
+# Under gunicorn the app starts serving at once and the broker warm-up (connection,
+# first quote, candle window) runs in a background thread per worker; LAZY_STARTUP=0
+# restores the old blocking load at import
+LAZY_STARTUP = __name__ != '__main__' and os.getenv('LAZY_STARTUP', '1') != '0'
+# Warm-up gets this many seconds to load the first snapshot before the dashboard
+# gives up waiting and starts on the fallback values
+WARMUP_TIMEOUT = float(os.getenv('WARMUP_TIMEOUT', 30))
+ready = threading.Event()
+startup_seconds = None
+warmup_error = None
+
 def get_ist_time():
     """Get current time in IST (UTC + 5:30)"""
     utc_now = datetime.utcnow()
@@ -16,7 +42,7 @@ def get_ist_time():
     return ist_time
 
 # Global variables to store data
-candles_data = []
+candles_data = CandleRing(25)
 hvd = "0"
 hr = 0
 cv = 0
@@ -26,25 +52,36 @@ volume_condition = False
 hv = 0
 is_market_hours = False
 
+# Live 1-minute candles are built from quotes; history is only refetched on
+# gaps and every RECONCILE_INTERVAL to pick up the broker's corrections
+candle_builder = CandleBuilder()
+last_reconcile = None
+RECONCILE_INTERVAL = timedelta(minutes=15)
+
 # Configuration variables (now configurable)
+MAX_CANDLES = 375  # one full trading session of 1-minute candles
 candles = 25
 instrument_token = 14283010
 ts = 'NFO:NIFTY25JUL24800CE'
 
+# Account whose enctoken drives the dashboard
+KITE_ACCOUNT = "AK1099"
+
 # Load configuration with environment variable fallback
 try:
-    with open('config.json') as f:
-        data = json.load(f)
-    enctoken = data.get("AK1099", os.getenv('KITE_ENCTOKEN'))
+    enctoken = config_store().get(KITE_ACCOUNT, os.getenv('KITE_ENCTOKEN'))
 except Exception as e:
     print(f"Error loading config.json: {e}")
     enctoken = os.getenv('KITE_ENCTOKEN')
 
+# Upstream latency/error counters, exposed on /metrics
+api_metrics = ApiMetrics()
+
 # Initialize KiteApp only if enctoken is available
 kite = None
 if enctoken:
     try:
-        kite = KiteApp(enctoken=enctoken)
+        kite = KiteApp(enctoken=enctoken, candle_store=CandleStore(), metrics=api_metrics, warm=not LAZY_STARTUP)
         print("KiteApp initialized successfully")
     except Exception as e:
         print(f"Error initializing KiteApp: {e}")
@@ -60,7 +97,6 @@ if kite is None:
     ltp = 60.3
     hvd = "2.43M"
     hr = 5.2
-    candles_data = []
 
 def get_last_trading_session_end():
     """Get the end time of the last trading session (3:30 PM IST)"""
@@ -91,20 +127,345 @@ def is_market_open():
     
     return market_start <= now <= market_end
 
+_instrument_index = None
+_instrument_index_lock = threading.Lock()
+
+def get_instrument_index():
+    """Today's symbol -> token index, rebuilt once the instrument master rolls over"""
+    global _instrument_index
+    if kite is None:
+        return None
+    with _instrument_index_lock:
+        if _instrument_index is None or _instrument_index.date != instrument_cache.get_ist_date():
+            _instrument_index = kite.instrument_index()
+            print(f"Loaded instrument index with {len(_instrument_index)} symbols")
+        return _instrument_index
+
 def get_instrument_token_from_ts(trading_symbol):
-    """Get instrument token from trading symbol using get_quote"""
+    """Get instrument token from trading symbol using the local instrument index"""
     try:
-        quote_data = get_quote(trading_symbol)
-        if quote_data and trading_symbol in quote_data:
-            return quote_data[trading_symbol]['instrument_token']
+        index = get_instrument_index()
+        if index is None:
+            # No broker session to download the instrument master, ask the quote API
+            quote_data = get_quote(trading_symbol)
+            token = quote_data[trading_symbol]['instrument_token'] if quote_data and trading_symbol in quote_data else None
         else:
+            token = index.token(trading_symbol)
+        if token is None:
             print(f"Could not find instrument token for {trading_symbol}")
-            return None
+        return token
     except Exception as e:
         print(f"Error getting instrument token for {trading_symbol}: {e}")
         return None
 
-def get_initial_quote():
+def get_instrument_tokens(trading_symbols):
+    """Resolve a list of trading symbols to {symbol: token or None} in one pass"""
+    index = get_instrument_index()
+    if index is None:
+        return {symbol: get_instrument_token_from_ts(symbol) for symbol in trading_symbols}
+    return index.resolve(trading_symbols)
+
+# Single owner of upstream quote traffic; everything else reads its snapshots
+poller = QuotePoller(lambda symbols: get_quote(symbols, api_metrics), [ts], interval=1.0, should_poll=lambda: is_market_open())
+# Pushes realtime and candle updates to /api/stream subscribers
+events = EventBroadcaster()
+# Additional instruments tracked alongside ts, polled in the same quote call
+watchlist = Watchlist(window=candles)
+
+def on_config_change(changes):
+    """Use a rotated enctoken as soon as config.json has it (e.g. after api_config.py runs)"""
+    token = changes.get(KITE_ACCOUNT)
+    if token and kite is not None and token != kite.enctoken:
+        kite.set_enctoken(token)
+        print(f"Switched to rotated enctoken for {KITE_ACCOUNT}")
+
+def refresh_poller_symbols():
+    poller.set_symbols([ts] + [symbol for symbol in watchlist.symbols() if symbol != ts])
+
+# One worker (the leader, elected through a lock file) polls the broker and runs the
+# update loop; it publishes its state to a memory-mapped snapshot that the other
+# workers apply, so broker traffic does not grow with the worker count.
+# SHARED_STATE=0 makes every worker poll on its own as before.
+SHARED_STATE = os.getenv('SHARED_STATE', '1') != '0'
+leader_lock = LeaderLock()
+# Realtime values are published every second, candle windows only when one of them changed
+shared_snapshot = None
+windows_snapshot = None
+# Config and watchlist changes made on any worker, applied by the leader
+CONTROL_PATH = os.path.join(STATE_DIR, 'dashboard_control.json')
+
+def is_producer():
+    """True in the process that talks to the broker for market data"""
+    return not SHARED_STATE or leader_lock.is_leader
+
+_background_pid = None
+
+def start_background():
+    """Start the quote poller and update loop once per process (gunicorn forks after import)"""
+    global _background_pid, startup_started
+    if _background_pid == os.getpid():
+        return
+    _background_pid = os.getpid()
+    if _background_pid != IMPORT_PID:
+        # Forked from a preloading master: this worker's startup begins now, not at the master's import
+        startup_started = time.time()
+    if kite is not None:
+        config_store().watch(on_config_change)
+    if SHARED_STATE:
+        threading.Thread(target=coordinate, name="shared-state", daemon=True).start()
+    else:
+        start_producer()
+
+def start_producer():
+    # Uploads spooled by an earlier run are replayed without waiting for a new failure
+    resume_spool()
+    if kite is not None:
+        poller.start()
+    if ready.is_set():
+        start_update_loop()
+    else:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+def coordinate():
+    """Follow the leader's snapshots until this worker wins the leader lock, then produce"""
+    global shared_snapshot, windows_snapshot
+    shared_snapshot = SharedSnapshot()
+    windows_snapshot = SharedSnapshot(os.path.join(STATE_DIR, 'market_windows.bin'))
+    applied = None
+    while True:
+        if leader_lock.try_acquire():
+            print(f"Worker {os.getpid()} is now the market data leader")
+            # Followers must not show a previous leader's state while this one warms up
+            shared_snapshot.write(None)
+            control = config_store(CONTROL_PATH)
+            apply_control(control.snapshot())
+            control.watch(lambda changes: apply_control(control.snapshot()))
+            start_producer()
+            return
+        try:
+            seq, state = shared_snapshot.wait_for_update(applied or 0, timeout=1.0)
+            if seq != applied and state is not None:
+                apply_shared_state(state)
+            applied = seq
+        except Exception as e:
+            print(f"Error reading shared market state: {e}")
+            time.sleep(1)
+
+def shared_state_payload():
+    snapshot = poller.latest()
+    return {
+        'ready': ready.is_set(),
+        'startup_seconds': startup_seconds,
+        'warmup_error': warmup_error,
+        'ts': ts,
+        'instrument_token': instrument_token,
+        'candles': candles,
+        'cv': cv,
+        'ltp': ltp,
+        'current_time': current_time,
+        'volume_condition': volume_condition,
+        'is_market_hours': is_market_hours,
+        'hvd': hvd,
+        'hr': hr,
+        'hv': hv,
+        'quotes_fetched_at': snapshot.fetched_at,
+        'watchlist': [(state.symbol, state.instrument_token, state.ltp, state.cv, state.volume_condition,
+                       state.updated_at)
+                      for state in map(watchlist.get, watchlist.symbols()) if state is not None],
+    }
+
+def windows_key():
+    """Changes whenever the main window or any watched symbol's window changed"""
+    # The seq and versions are local counters, a new leader can repeat a previous leader's values
+    return (leader_lock.epoch, events.last_seq('candles'),
+            tuple((state.symbol, state.candles_version)
+                  for state in map(watchlist.get, watchlist.symbols()) if state is not None))
+
+def windows_payload(key):
+    return {
+        'epoch': key[0],
+        'candles_seq': key[1],
+        'candles_data': candles_data.to_list(),
+        'watchlist': {state.symbol: (state.candles_version, state.candles.to_list())
+                      for state in map(watchlist.get, watchlist.symbols()) if state is not None},
+    }
+
+_published_windows_key = None
+
+def publish_shared_state():
+    global _published_windows_key
+    if SHARED_STATE and leader_lock.is_leader and shared_snapshot is not None:
+        key = windows_key()
+        if key != _published_windows_key:
+            # Windows first, so a follower never sees realtime values for a window it cannot read yet
+            windows_snapshot.write(windows_payload(key))
+            _published_windows_key = key
+        shared_snapshot.write(shared_state_payload())
+
+_applied_windows_seq = None
+_applied_candles_seq = None
+_applied_symbol_versions = {}
+
+def apply_shared_windows():
+    """Follower: rebuild the candle windows that changed since the last applied windows snapshot"""
+    global candles_data, _applied_windows_seq, _applied_candles_seq
+    seq, windows = windows_snapshot.read()
+    if windows is None or seq == _applied_windows_seq:
+        return
+    _applied_windows_seq = seq
+    epoch = windows['epoch']
+    if (epoch, windows['candles_seq']) != _applied_candles_seq:
+        window = CandleRing(candles)
+        for candle in windows['candles_data']:
+            window.append_candle(candle)
+        candles_data = window
+        _applied_candles_seq = (epoch, windows['candles_seq'])
+        events.publish('candles', table_payload())
+    for symbol, (version, records) in windows['watchlist'].items():
+        symbol_state = watchlist.get(symbol)
+        if symbol_state is not None and _applied_symbol_versions.get(symbol) != (epoch, version):
+            symbol_state.seed(records)
+            _applied_symbol_versions[symbol] = (epoch, version)
+
+def apply_shared_state(state):
+    """Follower: take over the leader's published state and notify local stream clients"""
+    global ts, instrument_token, candles, cv, ltp, current_time, volume_condition, is_market_hours
+    global hvd, hr, hv
+    ts, instrument_token, candles = state['ts'], state['instrument_token'], state['candles']
+    cv, ltp, current_time = state['cv'], state['ltp'], state['current_time']
+    volume_condition, is_market_hours = state['volume_condition'], state['is_market_hours']
+    hvd, hr, hv = state['hvd'], state['hr'], state['hv']
+
+    if watchlist.window != candles:
+        watchlist.resize(candles)
+    published = {entry[0] for entry in state['watchlist']}
+    for symbol in watchlist.symbols():
+        if symbol not in published:
+            watchlist.remove(symbol)
+            _applied_symbol_versions.pop(symbol, None)
+    for symbol, token, *_ in state['watchlist']:
+        watchlist.add(symbol, token)
+    # Seeding a window resets the symbol's LTP, so the live values go on afterwards
+    apply_shared_windows()
+    for symbol, token, symbol_ltp, symbol_cv, condition, updated_at in state['watchlist']:
+        symbol_state = watchlist.get(symbol)
+        symbol_state.ltp, symbol_state.cv = symbol_ltp, symbol_cv
+        symbol_state.volume_condition, symbol_state.updated_at = condition, updated_at
+
+    publish_realtime()
+    if state['ready'] and not ready.is_set():
+        mark_ready()
+
+def apply_control(values):
+    """Leader: apply config and watchlist changes recorded by any worker"""
+    try:
+        target = (values.get('ts'), values.get('candles'), values.get('instrument_token'))
+        if None not in target and target != (ts, candles, instrument_token):
+            apply_config(target[1], target[0], target[2])
+        wanted = {key[len('watch:'):]: token for key, token in values.items()
+                  if key.startswith('watch:') and token is not None}
+        for symbol in watchlist.symbols():
+            if symbol not in wanted:
+                watchlist.remove(symbol)
+        for symbol, token in wanted.items():
+            if symbol not in watchlist:
+                watch_symbol(symbol, token)
+        refresh_poller_symbols()
+    except Exception as e:
+        print(f"Error applying shared dashboard config: {e}")
+
+def record_control(values):
+    """Persist a config/watchlist change so the leader (and any future leader) applies it"""
+    if SHARED_STATE:
+        config_store(CONTROL_PATH).update(values)
+
+def start_update_loop():
+    update_thread = threading.Thread(target=update_data, daemon=True)
+    update_thread.start()
+
+def initial_load(label="", current=None):
+    """First quote and candle window for the current market state.
+
+    `current`, when given, is asked before any result is applied; once it
+    returns False the load's results are dropped.
+    """
+    global is_market_hours
+    is_market_hours = is_market_open()
+    
+    # Ensure we have fallback data even if API fails
+    apply_fallback_values()
+    
+    if is_market_hours:
+        # Market is open - initialize with current time data
+        get_initial_quote(current)
+        curr_time = get_ist_time()
+        end_time = curr_time - timedelta(minutes=1)
+        start_time = end_time - timedelta(minutes=candles)
+        print(f"{label}Initializing with live data: {start_time.strftime('%H:%M')} to {end_time.strftime('%H:%M')}")
+    else:
+        # Market is closed - initialize with last 25 minutes of previous session
+        session_end = get_last_trading_session_end()
+        start_time = session_end - timedelta(minutes=candles)
+        end_time = session_end
+        print(f"{label}Initializing with historical data: {start_time.strftime('%H:%M')} to {end_time.strftime('%H:%M')}")
+    
+    past_candles(start_time, end_time, current=current)
+
+def apply_fallback_values():
+    global cv, ltp
+    if cv == 0:
+        cv = 243000
+    if ltp == 0:
+        ltp = 60.3
+
+def mark_ready():
+    global startup_seconds
+    startup_seconds = time.time() - startup_started
+    ready.set()
+    print(f"Ready after {startup_seconds:.2f}s")
+
+# Set when warm-up stops waiting for its load; the late load's results are then dropped
+warmup_abandoned = threading.Event()
+
+def warmup_current():
+    return not warmup_abandoned.is_set()
+
+def load_first_snapshot():
+    global warmup_error
+    if kite is not None:
+        try:
+            kite.warm_up()
+        except Exception as e:
+            print(f"Error warming up broker connection: {e}")
+    try:
+        initial_load("Warm-up: ", warmup_current)
+    except Exception as e:
+        if warmup_current():
+            warmup_error = str(e)
+        print(f"Error during warm-up: {e}")
+
+def warm_up():
+    """Background warm-up: broker connection, first snapshot, then the update loop.
+
+    The load gets WARMUP_TIMEOUT seconds; after that the worker stops
+    waiting for it, marks itself ready on the fallback values and starts
+    the update loop, which reconciles the candle window on its own. The
+    abandoned load keeps running but applies nothing, so it cannot race
+    the live loop.
+    """
+    global warmup_error
+    loader = threading.Thread(target=load_first_snapshot, name="warm-up-load", daemon=True)
+    loader.start()
+    loader.join(WARMUP_TIMEOUT)
+    if loader.is_alive():
+        warmup_abandoned.set()
+        warmup_error = f"Warm-up did not finish within {WARMUP_TIMEOUT:g}s"
+        print(f"{warmup_error}, starting with fallback values")
+        apply_fallback_values()
+    mark_ready()
+    start_update_loop()
+
+def get_initial_quote(current=None):
     global minus_volume, ltp
     try:
         if kite is None:
@@ -113,30 +474,65 @@ def get_initial_quote():
             ltp = 50.0
             return
             
-        q = get_quote(ts)
+        q = poller.refresh().quotes
+        if current is not None and not current():
+            return
+        candle_builder.reset()
         minus_volume = q[ts]['volume']
         ltp = q[ts]['last_price']
         print(f"Initial Volume: {minus_volume}, Initial LTP: {ltp}")
     except Exception as e:
         print(f"Error getting initial quote: {e}")
+        if current is not None and not current():
+            return
         minus_volume = 1000000  # Default values for demo
         ltp = 50.0
 
 def get_current_ltp():
-    """Get current LTP from quote API"""
+    """Get current LTP from the latest poller snapshot"""
     global ltp
     try:
         if kite is None:
             # Return dummy data for demo
             return ltp if ltp > 0 else 50.0
             
-        q = get_quote(ts)
+        q = poller.latest().quotes
         ltp = q[ts]['last_price']
         return ltp
     except Exception as e:
         print(f"Error getting current LTP: {e}")
         return ltp if ltp > 0 else 50.0  # Return existing LTP or default
 
+def realtime_payload():
+    return {
+        'cv': cv,
+        'cv_formatted': format_volume(cv),
+        'ltp': ltp,
+        'current_time': current_time,
+        'volume_condition': volume_condition,
+        'is_market_hours': is_market_hours
+    }
+
+def table_payload():
+    return {
+        'candles_data': candles_json(),
+        'hvd': hvd,
+        'hr': hr,
+        'hv': hv,
+        'instrument_symbol': ts,
+        'is_market_hours': is_market_hours
+    }
+
+_last_realtime = None
+
+def publish_realtime():
+    """Push realtime values to stream subscribers when any of them changed"""
+    global _last_realtime
+    state = (cv, ltp, volume_condition, is_market_hours)
+    if state != _last_realtime:
+        _last_realtime = state
+        events.publish('realtime', realtime_payload())
+
 def format_volume(volume):
     """Format volume in K and M format"""
     if volume >= 1_000_000:
@@ -146,13 +542,23 @@ def format_volume(volume):
     else:
         return str(volume)
 
-def past_candles(start_time, end_time):
-    global candles_data, hvd, hr, hv, ltp
+def set_candle_stats():
+    """Refresh HVD/HR from the window's running maxima"""
+    global hvd, hr, hv
+    hv = candles_data.hv
+    hvd = format_volume(hv)
+    hr = round(candles_data.hr, 2)
+
+def candles_json():
+    return [dict(candle, volume_formatted=format_volume(candle['volume'])) for candle in candles_data]
+
+def past_candles(start_time, end_time, refresh=False, current=None):
+    global candles_data, ltp
     try:
+        window = CandleRing(candles)
         if kite is None:
             print("KiteApp not initialized, generating dummy candle data")
             # Generate dummy candle data for demo
-            candles_data = []
             base_price = 50.0
             base_volume = 1000000
             
@@ -164,66 +570,52 @@ def past_candles(start_time, end_time):
                 close_price = open_price + (i % 2 - 0.5) * 2
                 volume = base_volume + (i * 50000) + (i % 7) * 100000
                 
-                candle = {
-                    'date': candle_time.strftime('%Y-%m-%d %H:%M:%S'),
-                    'open': round(open_price, 2),
-                    'high': round(high_price, 2),
-                    'low': round(low_price, 2),
-                    'close': round(close_price, 2),
-                    'volume': volume,
-                    'range': round(high_price - low_price, 2),
-                    'volume_formatted': format_volume(volume)
-                }
-                candles_data.append(candle)
+                window.append(candle_time.strftime('%Y-%m-%d %H:%M:%S'), round(open_price, 2),
+                              round(high_price, 2), round(low_price, 2), round(close_price, 2), volume)
             
+            if current is not None and not current():
+                return
+            candles_data = window
             # Calculate HVD and HR
             if candles_data:
-                hv_candle = max(candles_data, key=lambda x: x['volume'])
-                hv = hv_candle['volume']
-                hvd = format_volume(hv)
-
-                hr_candle = max(candles_data, key=lambda x: x['range'])
-                hr = round(hr_candle['range'], 2)
+                set_candle_stats()
                 
                 # Set LTP from the last candle
                 ltp = candles_data[-1]['close']
                 
                 print(f"Generated dummy candles - HVD: {hvd}, HR: {hr}, LTP: {ltp}")
+            events.publish('candles', table_payload())
             return
             
         print(f"Fetching candles for instrument_token: {instrument_token}")
         print(f"Time range: {start_time.strftime('%Y-%m-%d %H:%M:%S')} to {end_time.strftime('%Y-%m-%d %H:%M:%S')}")
         
-        candles_data = kite.historical_data(
+        records = kite.historical_data(
             instrument_token,
             start_time.strftime("%Y-%m-%d %H:%M:%S"),
             end_time.strftime("%Y-%m-%d %H:%M:%S"),
             'minute',
-            False
+            False,
+            refresh=refresh
         )
 
-        print(f"Received {len(candles_data) if candles_data else 0} candles")
+        print(f"Received {len(records) if records else 0} candles")
 
-        for candle in candles_data:
-            if isinstance(candle, dict) and 'high' in candle and 'low' in candle:
-                candle['range'] = candle['high'] - candle['low']
-            # Format volume for display
-            if isinstance(candle, dict) and 'volume' in candle:
-                candle['volume_formatted'] = format_volume(candle['volume'])
+        for candle in records:
+            window.append_candle(candle)
+        if current is not None and not current():
+            print("Dropping candles from an abandoned load")
+            return
+        candles_data = window
 
         if candles_data:
-            hv_candle = max((candle for candle in candles_data if 'volume' in candle), key=lambda x: x['volume'])
-            hv = hv_candle['volume']
-            vol = hv_candle['volume']
-            hvd = format_volume(vol)
-
-            hr_candle = max((candle for candle in candles_data if 'range' in candle), key=lambda x: x['range'])
-            hr = round(hr_candle['range'], 2)
+            set_candle_stats()
             
             # Set LTP from the last candle
             ltp = candles_data[-1]['close']
             
             print(f"Processed candles - HVD: {hvd}, HR: {hr}, LTP: {ltp}")
+            events.publish('candles', table_payload())
         else:
             print("No candles data received")
     except Exception as e:
@@ -231,9 +623,59 @@ def past_candles(start_time, end_time):
         import traceback
         traceback.print_exc()
 
+def append_candle(candle):
+    """Add a finished live candle to the window and refresh HVD/HR"""
+    candles_data.append_candle(candle)
+    set_candle_stats()
+    print(f"Appended live candle {candle['date'].strftime('%H:%M')} - HVD: {hvd}, HR: {hr}")
+    events.publish('candles', table_payload())
+
+def reconcile_candles(now):
+    """Reload the candle window from historical data"""
+    global last_reconcile
+    last_reconcile = now
+    end_time = now - timedelta(minutes=1)
+    start_time = end_time - timedelta(minutes=candles)
+    # Bypass the candle store so corrected or late-published candles replace the stored ones
+    past_candles(start_time, end_time, refresh=True)
+
+def update_live_candle(now, price, cumulative_volume):
+    """Feed the latest quote into the candle builder, appending bars as minutes close"""
+    closed = candle_builder.update(now, price, cumulative_volume)
+    if closed is None:
+        return
+    last_date = candles_data[-1]['date'] if candles_data else None
+    gap = not isinstance(last_date, datetime) or closed['date'] - last_date != timedelta(minutes=1)
+    due = last_reconcile is None or now - last_reconcile >= RECONCILE_INTERVAL
+    if gap or due or candle_builder.last_closed_partial:
+        # Missed minutes, a bar we only saw part of, or periodic check against the broker
+        reconcile_candles(now)
+        last_date = candles_data[-1]['date'] if candles_data else None
+        if not candle_builder.last_closed_partial and (not isinstance(last_date, datetime)
+                                                       or last_date < closed['date']):
+            # The broker has not published the bar that just closed yet; without ours the next
+            # bar would look like a gap and trigger another full reconcile
+            append_candle(closed)
+    else:
+        append_candle(closed)
+
+# update_data() aims to run once a second; lag is how much later than that an iteration starts
+LOOP_INTERVAL = 1.0
+loop_lag = Histogram(LATENCY_BUCKETS)
+last_loop_at = None
+
+def mark_loop_iteration():
+    global last_loop_at
+    now = time.time()
+    if last_loop_at is not None:
+        loop_lag.observe(max(0.0, now - last_loop_at - LOOP_INTERVAL))
+    last_loop_at = now
+
 def update_data():
     global cv, ltp, current_time, volume_condition, minus_volume, is_market_hours
+    seen_seq = 0
     while True:
+        mark_loop_iteration()
         try:
             # Get current time in IST
             now = get_ist_time()
@@ -244,18 +686,11 @@ def update_data():
             
             if is_market_hours:
                 # Market is open - update real-time data
-                if now.second == 0:
-                    # Update candles data every minute
+                if now.second == 0 and kite is None:
+                    # Regenerate dummy candles every minute
                     end_time = now - timedelta(minutes=1)
                     start_time = end_time - timedelta(minutes=candles)
                     past_candles(start_time, end_time)
-                    
-                    # Update minus_volume
-                    try:
-                        q = get_quote(ts)
-                        minus_volume = q[ts]['volume']
-                    except Exception as e:
-                        print(f"Error updating minus_volume: {e}")
                 
                 # Update real-time data every second
                 try:
@@ -265,10 +700,13 @@ def update_data():
                         ltp = 60.3 + (now.second % 10) * 0.1  # Simulate changing price
                         volume_condition = cv >= hv
                     else:
-                        q = get_quote(ts)
-                        cv = q[ts]['volume'] - minus_volume
+                        q = poller.latest().quotes
                         ltp = q[ts]['last_price']
+                        update_live_candle(now, ltp, q[ts]['volume'])
+                        # Volume traded so far in the current minute
+                        cv = candle_builder.current['volume']
                         volume_condition = cv >= hv
+                        watchlist.apply(now, q)
                     print(f"Real-time update - CV: {cv}, LTP: {ltp}")
                 except Exception as e:
                     print(f"Error updating real-time data: {e}")
@@ -299,11 +737,41 @@ def update_data():
                         ltp = 0
                         print("No historical data available for LTP")
             
-            time.sleep(1)
+            publish_realtime()
+            publish_shared_state()
+            if is_market_hours and kite is not None:
+                # Wake up as soon as the poller publishes a new snapshot
+                seen_seq = poller.wait_for_update(seen_seq, timeout=1).seq
+            else:
+                time.sleep(1)
         except Exception as e:
             print(f"Error in update_data: {e}")
             time.sleep(1)
 
+@app.before_request
+def ensure_background():
+    start_background()
+    g.request_started = time.perf_counter()
+
+# Per-route request latency and response counts, exposed on /metrics
+route_latency = {}
+route_responses = {}
+_route_metrics_lock = threading.Lock()
+
+@app.after_request
+def record_route_latency(response):
+    started = getattr(g, 'request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        with _route_metrics_lock:
+            histogram = route_latency.get((route, request.method))
+            if histogram is None:
+                histogram = route_latency[(route, request.method)] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(time.perf_counter() - started)
+            key = (route, response.status_code)
+            route_responses[key] = route_responses.get(key, 0) + 1
+    return response
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -330,6 +798,19 @@ def init_data():
     """Manually trigger data initialization"""
     global is_market_hours, cv, ltp, candles_data, hvd, hr
     
+    if not is_producer():
+        # Followers show the leader's data, loading it here again would only add broker traffic
+        return jsonify({
+            'status': 'success',
+            'message': 'Data is loaded by the leader worker',
+            'cv': cv,
+            'ltp': ltp,
+            'hvd': hvd,
+            'hr': hr,
+            'candles_count': len(candles_data),
+            'is_market_hours': is_market_hours
+        })
+    
     try:
         is_market_hours = is_market_open()
         
@@ -361,10 +842,59 @@ def init_data():
             'message': str(e)
         })
 
+def candle_window_range():
+    """(start, end) of the candle window for the current market state"""
+    if is_market_open():
+        end_time = get_ist_time() - timedelta(minutes=1)
+    else:
+        end_time = get_last_trading_session_end()
+    return end_time - timedelta(minutes=candles), end_time
+
+def watched_state():
+    """SymbolState for the request's ?symbol= parameter, or None when it is the main instrument"""
+    symbol = request.args.get('symbol')
+    if not symbol or symbol == ts:
+        return None
+    state = watchlist.get(symbol)
+    if state is None:
+        raise KeyError(symbol)
+    return state
+
+def symbol_realtime_payload(state):
+    return {
+        'symbol': state.symbol,
+        'cv': state.cv,
+        'cv_formatted': format_volume(state.cv),
+        'ltp': state.ltp,
+        'current_time': current_time,
+        'volume_condition': state.volume_condition,
+        'is_market_hours': is_market_hours
+    }
+
+def symbol_table_payload(state):
+    window = state.candles
+    return {
+        'candles_data': [dict(candle, volume_formatted=format_volume(candle['volume'])) for candle in window],
+        'hvd': format_volume(window.hv),
+        'hr': round(window.hr, 2),
+        'hv': window.hv,
+        'instrument_symbol': state.symbol,
+        'is_market_hours': is_market_hours
+    }
+
+def unknown_symbol():
+    return jsonify({'success': False, 'error': f"{request.args.get('symbol')} is not in the watchlist"}), 404
+
 @app.route('/api/data')
 def get_data():
+    try:
+        state = watched_state()
+    except KeyError:
+        return unknown_symbol()
+    if state is not None:
+        return jsonify(dict(symbol_table_payload(state), **symbol_realtime_payload(state)))
     return jsonify({
-        'candles_data': candles_data,
+        'candles_data': candles_json(),
         'hvd': hvd,
         'hr': hr,
         'cv': cv,
@@ -379,101 +909,241 @@ def get_data():
 
 @app.route('/api/realtime_data')
 def get_realtime_data():
-    """API endpoint for real-time data that updates every second"""
-    global cv, ltp, current_time, volume_condition, is_market_hours
-    
+    """API endpoint for real-time data, served from the state kept by update_data()"""
     try:
-        # Always fetch fresh data on each request
-        if kite is not None:
-            # Get current LTP
-            current_ltp = get_current_ltp()
-            if current_ltp > 0:
-                ltp = current_ltp
-            
-            # Get current quote for volume calculation
-            try:
-                q = get_quote(ts)
-                if ts in q:
-                    current_volume = q[ts]['volume']
-                    if 'minus_volume' in globals() and minus_volume > 0:
-                        cv = current_volume - minus_volume
-                    else:
-                        cv = current_volume
-            except Exception as e:
-                print(f"Error getting quote for CV: {e}")
-                # Keep existing CV if API fails
-                if cv == 0:
-                    cv = 243000
-        else:
-            # Dummy data mode - simulate some variation
-            import random
-            if cv == 0:
-                cv = 243000
-            if ltp == 0:
-                ltp = 60.3
-            
-            # Add small random variation to simulate real-time updates
-            cv += random.randint(-5000, 5000)
-            if cv < 0:
-                cv = 0
-            ltp += random.uniform(-0.5, 0.5)
-            if ltp < 0:
-                ltp = 0.1
-        
-        # Update current time
-        current_time = get_ist_time().strftime("%H:%M:%S")
-        
-        # Update market hours status
-        is_market_hours = is_market_open()
-        
-        # Update volume condition
-        volume_condition = cv > 100000  # Simple threshold
-        
-    except Exception as e:
-        print(f"Error in realtime_data: {e}")
-        # Fallback to existing data
-        if cv == 0:
-            cv = 243000
-        if ltp == 0:
-            ltp = 60.3
-        if not current_time:
-            current_time = get_ist_time().strftime("%H:%M:%S")
-    
-    return jsonify({
-        'cv': cv,
-        'cv_formatted': format_volume(cv),
-        'ltp': ltp,
-        'current_time': current_time,
-        'volume_condition': volume_condition,
-        'is_market_hours': is_market_hours
-    })
+        state = watched_state()
+    except KeyError:
+        return unknown_symbol()
+    if state is not None:
+        return jsonify(symbol_realtime_payload(state))
+    return jsonify(realtime_payload())
 
 @app.route('/api/table_data')
 def get_table_data():
     """API endpoint for table data that updates only at 0th second"""
     global candles_data, hvd, hr, hv
     
-    # Ensure we have some data even if API fails
-    if not candles_data:
+    try:
+        state = watched_state()
+    except KeyError:
+        return unknown_symbol()
+    if state is not None:
+        return jsonify(symbol_table_payload(state))
+    
+    # Ensure we have some data even if API fails; during warm-up the window is still being
+    # loaded in the background, and followers only ever show the leader's window, so both
+    # serve the current (possibly empty) state instead of fetching it here
+    if not candles_data and ready.is_set() and is_producer():
         # Generate dummy candle data if none exists
         now = get_ist_time()
         end_time = now - timedelta(minutes=1)
         start_time = end_time - timedelta(minutes=candles)
         past_candles(start_time, end_time)
     
-    return jsonify({
-        'candles_data': candles_data,
-        'hvd': hvd,
-        'hr': hr,
-        'hv': hv,
-        'instrument_symbol': ts,
-        'is_market_hours': is_market_hours
-    })
+    return jsonify(table_payload())
+
+@app.route('/api/stream')
+def stream():
+    """Server-Sent Events stream of 'realtime' and 'candles' updates"""
+    return Response(events.subscribe(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/ready')
+def readiness():
+    """200 once the first snapshot is loaded or warm-up gave up after WARMUP_TIMEOUT, 503 before"""
+    elapsed = time.time() - startup_started
+    snapshot = poller.latest()
+    body = {
+        'ready': ready.is_set(),
+        'startup_seconds': startup_seconds,
+        'elapsed_seconds': round(elapsed, 3),
+        'snapshot_age': snapshot.age(),
+        'candles_count': len(candles_data),
+        'error': warmup_error,
+    }
+    if ready.is_set():
+        return jsonify(body)
+    return jsonify(body), 503
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus text exposition of update-loop, upstream and HTTP health"""
+    out = PrometheusWriter()
+    out.histogram('dashboard_update_loop_lag_seconds', loop_lag,
+                  help_text='How late each update loop iteration started versus its 1s schedule')
+    out.gauge('dashboard_update_loop_seconds_since_last_iteration',
+              time.time() - last_loop_at if last_loop_at else None,
+              help_text='Time since the update loop last started an iteration')
+    out.gauge('dashboard_market_open', is_market_hours, help_text='1 while the market is open')
+    out.gauge('dashboard_kite_available', kite is not None, help_text='1 when a broker session is configured')
+    out.gauge('dashboard_ready', ready.is_set(), help_text='1 once warm-up has loaded the first snapshot')
+    out.gauge('dashboard_startup_seconds', startup_seconds, help_text='Time from process (or forked worker) start to ready')
+    out.gauge('dashboard_market_data_leader', is_producer(),
+              help_text='1 in the worker that polls the broker for everyone')
+    out.gauge('dashboard_shared_snapshot_age_seconds',
+              shared_snapshot.age() if shared_snapshot is not None else None,
+              help_text='Age of the market state snapshot shared between workers')
+
+    snapshot = poller.latest()
+    out.gauge('dashboard_quote_snapshot_age_seconds', snapshot.age(),
+              help_text='Age of the latest successful quote poll')
+    out.gauge('dashboard_quote_snapshot_error', snapshot.error is not None,
+              help_text='1 when the latest quote poll failed')
+    out.counter('dashboard_quote_polls_total', poller.fetch_count, help_text='Successful upstream quote polls')
+    out.counter('dashboard_quote_poll_errors_total', poller.error_count, help_text='Failed upstream quote polls')
+    out.gauge('dashboard_quote_symbols', len(poller.symbols), help_text='Symbols fetched per quote poll')
+
+    api_metrics.write_prometheus(out)
+    if kite is not None:
+        scheduler = sorted(kite.scheduler.stats().items())
+        for name, stats in scheduler:
+            out.gauge('kite_api_queued_requests', stats['queued'], {'endpoint_class': name},
+                      'Requests waiting for a rate-limit slot')
+        for name, stats in scheduler:
+            out.gauge('kite_api_rate_limit_wait_max_seconds', stats['wait_max'], {'endpoint_class': name},
+                      'Longest rate-limit wait so far')
+
+    with _route_metrics_lock:
+        for (route, method), histogram in sorted(route_latency.items()):
+            out.histogram('dashboard_http_request_seconds', histogram, {'route': route, 'method': method},
+                          'Time to produce each HTTP response')
+        for (route, status), count in sorted(route_responses.items()):
+            out.counter('dashboard_http_responses_total', count, {'route': route, 'status': status},
+                        'HTTP responses by route and status')
+
+    out.gauge('dashboard_sse_clients', events.clients, help_text='Connected /api/stream clients')
+    out.gauge('dashboard_watchlist_symbols', len(watchlist), help_text='Symbols in the watchlist')
+    return Response(out.text(), mimetype='text/plain', content_type=PrometheusWriter.CONTENT_TYPE)
+
+@app.route('/api/watchlist')
+def get_watchlist():
+    """All watched symbols with their live values and volume-breakout flags"""
+    items = []
+    for symbol in watchlist.symbols():
+        state = watchlist.get(symbol)
+        if state is not None:
+            items.append(dict(symbol_realtime_payload(state), instrument_token=state.instrument_token,
+                              hv=state.candles.hv))
+    return jsonify({'success': True, 'symbols': items, 'breakouts': watchlist.breakouts()})
+
+def watch_symbol(symbol, token):
+    """Add one symbol to the watchlist; its candle window is seeded in the background"""
+    state = watchlist.add(symbol, token)
+    schedule_seed([symbol])
+    return state
+
+# Seeding needs one historical call per symbol (3/s), so it runs on its own thread
+# instead of inside the request that added the symbols
+_seed_queue = queue.Queue()
+_seed_pending = set()
+_seed_lock = threading.Lock()
+_seeder_pid = None
+
+def schedule_seed(symbols):
+    global _seeder_pid
+    if kite is None:
+        return
+    with _seed_lock:
+        for symbol in symbols:
+            if symbol not in _seed_pending:
+                _seed_pending.add(symbol)
+                _seed_queue.put(symbol)
+        if _seeder_pid != os.getpid():
+            _seeder_pid = os.getpid()
+            threading.Thread(target=seed_watchlist, name="watchlist-seeder", daemon=True).start()
+
+def seed_watchlist():
+    while True:
+        symbol = _seed_queue.get()
+        with _seed_lock:
+            _seed_pending.discard(symbol)
+        state = watchlist.get(symbol)
+        if state is None:
+            continue
+        start_time, end_time = candle_window_range()
+        try:
+            state.seed(kite.historical_data(state.instrument_token, start_time.strftime("%Y-%m-%d %H:%M:%S"),
+                                            end_time.strftime("%Y-%m-%d %H:%M:%S"), 'minute', False))
+        except Exception as e:
+            print(f"Error loading candles for {symbol}: {e}")
+
+@app.route('/api/watchlist', methods=['POST'])
+def add_to_watchlist():
+    """Add symbols to the watchlist: {"symbols": ["NFO:...", ...]}; their candles load in the background"""
+    try:
+        symbols = [str(symbol) for symbol in (request.get_json() or {}).get('symbols', [])]
+        if not symbols:
+            return jsonify({'success': False, 'error': 'Missing required parameter: symbols'})
+        tokens = get_instrument_tokens(symbols)
+        added, errors = [], {}
+        watched = len(watchlist)
+        for symbol, token in tokens.items():
+            if token is None:
+                errors[symbol] = 'Could not get instrument token'
+                continue
+            if not is_producer():
+                # The leader adds and seeds it; this worker sees it in the next shared snapshot
+                if symbol not in watchlist and watched >= Watchlist.MAX_SYMBOLS:
+                    errors[symbol] = f"Watchlist is limited to {Watchlist.MAX_SYMBOLS} symbols"
+                    continue
+                watched += symbol not in watchlist
+            else:
+                try:
+                    watch_symbol(symbol, token)
+                except ValueError as e:
+                    errors[symbol] = str(e)
+                    continue
+            added.append(symbol)
+        record_control({f'watch:{symbol}': tokens[symbol] for symbol in added})
+        refresh_poller_symbols()
+        return jsonify({'success': not errors, 'added': added, 'errors': errors})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/watchlist/<path:symbol>', methods=['DELETE'])
+def remove_from_watchlist(symbol):
+    if not watchlist.remove(symbol):
+        return jsonify({'success': False, 'error': f'{symbol} is not in the watchlist'}), 404
+    record_control({f'watch:{symbol}': None})
+    refresh_poller_symbols()
+    return jsonify({'success': True})
+
+def apply_config(new_candles, new_ts, new_instrument_token):
+    """Switch the main instrument/window and reload its candles"""
+    global candles, instrument_token, ts, is_market_hours
+    grew = new_candles > candles
+    candles = new_candles
+    instrument_token = new_instrument_token
+    ts = new_ts
+    refresh_poller_symbols()
+    watchlist.resize(candles)
+    if grew:
+        # Longer windows need history the rings never held
+        schedule_seed(watchlist.symbols())
+    
+    print(f"Updated configuration: candles={candles}, instrument_token={instrument_token}, ts={ts}")
+    
+    # Reinitialize with new configuration based on market hours
+    is_market_hours = is_market_open()
+    
+    if is_market_hours:
+        # Market is open - initialize with current time data
+        get_initial_quote()
+        curr_time = datetime.now()
+        end_time = curr_time - timedelta(minutes=1)
+        start_time = end_time - timedelta(minutes=candles)
+        print(f"Reinitializing with live data: {start_time.strftime('%H:%M')} to {end_time.strftime('%H:%M')}")
+    else:
+        # Market is closed - initialize with last 25 minutes of previous session
+        session_end = get_last_trading_session_end()
+        start_time = session_end - timedelta(minutes=candles)
+        end_time = session_end
+        print(f"Reinitializing with historical data: {start_time.strftime('%H:%M')} to {end_time.strftime('%H:%M')}")
+    
+    past_candles(start_time, end_time)
 
 @app.route('/api/update_config', methods=['POST'])
 def update_config():
-    global candles, instrument_token, ts, minus_volume, is_market_hours
-    
     try:
         data = request.get_json()
         
@@ -485,44 +1155,23 @@ def update_config():
         new_ts = str(data['ts'])
         
         # Validate ranges
-        if new_candles < 1 or new_candles > 100:
-            return jsonify({'success': False, 'error': 'Candles must be between 1 and 100'})
+        if new_candles < 1 or new_candles > MAX_CANDLES:
+            return jsonify({'success': False, 'error': f'Candles must be between 1 and {MAX_CANDLES}'})
         
         # Get instrument token automatically from trading symbol
         new_instrument_token = get_instrument_token_from_ts(new_ts)
         if new_instrument_token is None:
             return jsonify({'success': False, 'error': f'Could not get instrument token for {new_ts}'})
         
-        # Update configuration
-        candles = new_candles
-        instrument_token = new_instrument_token
-        ts = new_ts
-        
-        print(f"Updated configuration: candles={candles}, instrument_token={instrument_token}, ts={ts}")
-        
-        # Reinitialize with new configuration based on market hours
-        is_market_hours = is_market_open()
-        
-        if is_market_hours:
-            # Market is open - initialize with current time data
-            get_initial_quote()
-            curr_time = datetime.now()
-            end_time = curr_time - timedelta(minutes=1)
-            start_time = end_time - timedelta(minutes=candles)
-            print(f"Reinitializing with live data: {start_time.strftime('%H:%M')} to {end_time.strftime('%H:%M')}")
-        else:
-            # Market is closed - initialize with last 25 minutes of previous session
-            session_end = get_last_trading_session_end()
-            start_time = session_end - timedelta(minutes=candles)
-            end_time = session_end
-            print(f"Reinitializing with historical data: {start_time.strftime('%H:%M')} to {end_time.strftime('%H:%M')}")
-        
-        past_candles(start_time, end_time)
+        # Update configuration; on a follower the leader picks it up from the control file
+        if is_producer():
+            apply_config(new_candles, new_ts, new_instrument_token)
+        record_control({'ts': new_ts, 'candles': new_candles, 'instrument_token': new_instrument_token})
         
         return jsonify({
             'success': True, 
-            'instrument_token': instrument_token,
-            'message': f'Configuration updated successfully. Instrument token: {instrument_token}'
+            'instrument_token': new_instrument_token,
+            'message': f'Configuration updated successfully. Instrument token: {new_instrument_token}'
         })
         
     except Exception as e:
@@ -545,6 +1194,16 @@ def refresh_candles():
     """API endpoint to manually refresh candle data for debugging"""
     global candles_data, hvd, hr, hv
     
+    if not is_producer():
+        return jsonify({
+            'success': True,
+            'candles_count': len(candles_data),
+            'hvd': hvd,
+            'hr': hr,
+            'is_market_hours': is_market_hours,
+            'message': 'Candles are refreshed by the leader worker'
+        })
+    
     try:
         is_market_hours = is_market_open()
         
@@ -591,56 +1250,17 @@ def get_ltp_api():
 
 if __name__ == '__main__':
     # Initialize data based on market hours
-    is_market_hours = is_market_open()
+    initial_load()
+    mark_ready()
     
-    if is_market_hours:
-        # Market is open - initialize with current time data
-        get_initial_quote()
-        curr_time = datetime.now()
-        end_time = curr_time - timedelta(minutes=1)
-        start_time = end_time - timedelta(minutes=candles)
-        print(f"Initializing with live data: {start_time.strftime('%H:%M')} to {end_time.strftime('%H:%M')}")
-    else:
-        # Market is closed - initialize with last 25 minutes of previous session
-        session_end = get_last_trading_session_end()
-        start_time = session_end - timedelta(minutes=candles)
-        end_time = session_end
-        print(f"Initializing with historical data: {start_time.strftime('%H:%M')} to {end_time.strftime('%H:%M')}")
-    
-    past_candles(start_time, end_time)
-    
-    # Start background thread for data updates
-    update_thread = threading.Thread(target=update_data, daemon=True)
-    update_thread.start()
+    # Start background threads for data updates
+    start_background()
     
     app.run(debug=True, host='0.0.0.0', port=5001)
-else:
-    # For production deployment (like Render), initialize data immediately
+elif not LAZY_STARTUP:
+    # Blocking load at import, background threads are started per worker by
+    # ensure_background() since threads started here would not survive gunicorn
+    # forking the preloaded app
     print("Production deployment detected - initializing data...")
-    is_market_hours = is_market_open()
-    
-    # Ensure we have fallback data even if API fails
-    if cv == 0:
-        cv = 243000
-    if ltp == 0:
-        ltp = 60.3
-    
-    if is_market_hours:
-        # Market is open - initialize with current time data
-        get_initial_quote()
-        curr_time = get_ist_time()
-        end_time = curr_time - timedelta(minutes=1)
-        start_time = end_time - timedelta(minutes=candles)
-        print(f"Production: Initializing with live data: {start_time.strftime('%H:%M')} to {end_time.strftime('%H:%M')}")
-    else:
-        # Market is closed - initialize with last 25 minutes of previous session
-        session_end = get_last_trading_session_end()
-        start_time = session_end - timedelta(minutes=candles)
-        end_time = session_end
-        print(f"Production: Initializing with historical data: {start_time.strftime('%H:%M')} to {end_time.strftime('%H:%M')}")
-    
-    past_candles(start_time, end_time)
-    
-    # Start background thread for data updates
-    update_thread = threading.Thread(target=update_data, daemon=True)
-    update_thread.start() 
\ No newline at end of file
+    initial_load("Production: ")
+    mark_ready()